@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+做题记录的增量统计: 每个 (用户, 运算, 题目) 保存一份累计值, 每追加一条记录就更新, 查询时不需要扫描历史.
+运算为 '*' 表示该用户的全部运算, 题目为 '' 表示该运算的全部题目.
+"""
+import json
+import math
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+ALL: str = '*'
+EWMA: float = 0.1   # 趋势的平滑系数, 约等于最近 20 题
+
+
+class QuantileSketch:
+    """对数分桶的分位数估计(DDSketch), 相对误差不超过 accuracy, 桶数与样本数无关"""
+
+    def __init__(self, accuracy: float = 0.02, buckets: Optional[Dict[int, int]] = None):
+        self.accuracy: float = accuracy
+        self.gamma: float = (1 + accuracy) / (1 - accuracy)
+        self.buckets: Dict[int, int] = buckets or {}
+        self.count: int = sum(self.buckets.values())
+
+    def add(self, value: float):
+        index = math.ceil(math.log(max(value, 1e-3), self.gamma))
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * (self.count - 1)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 0.0
+
+    def to_json(self) -> Dict:
+        return {'accuracy': self.accuracy, 'buckets': self.buckets}
+
+    @classmethod
+    def from_json(cls, data: Dict) -> 'QuantileSketch':
+        return cls(data['accuracy'], {int(k): v for k, v in data['buckets'].items()})
+
+
+class Aggregate:
+    """一组记录的累计统计"""
+
+    def __init__(self, data: Optional[Dict] = None):
+        data = data or {}
+        self.total: int = data.get('total', 0)
+        self.correct: int = data.get('correct', 0)
+        self.latency_sum: float = data.get('latency_sum', 0.0)   # 答对题目的总用时
+        self.latency = QuantileSketch.from_json(data['latency']) if 'latency' in data else QuantileSketch()
+        self.trend_accuracy: float = data.get('trend_accuracy', 0.0)
+        self.trend_latency: float = data.get('trend_latency', 0.0)
+        self.last_at: float = data.get('last_at', 0.0)
+
+    def add(self, correct: bool, latency: float, finish_at: float):
+        first = self.total == 0
+        self.total += 1
+        self.correct += int(correct)
+        self.trend_accuracy = float(correct) if first else (1 - EWMA) * self.trend_accuracy + EWMA * float(correct)
+        if correct:
+            self.latency_sum += latency
+            self.trend_latency = latency if not self.latency.count else (1 - EWMA) * self.trend_latency + EWMA * latency
+            self.latency.add(latency)
+        self.last_at = max(self.last_at, finish_at)
+
+    @property
+    def accuracy(self) -> float:
+        return self.correct / self.total if self.total else 0.0
+
+    @property
+    def mean_latency(self) -> float:
+        return self.latency_sum / self.correct if self.correct else 0.0
+
+    def to_json(self) -> Dict:
+        return {
+            'total': self.total,
+            'correct': self.correct,
+            'latency_sum': self.latency_sum,
+            'latency': self.latency.to_json(),
+            'trend_accuracy': self.trend_accuracy,
+            'trend_latency': self.trend_latency,
+            'last_at': self.last_at,
+        }
+
+
+class Analytics:
+    """累计统计保存在 history 数据库的 aggregates 表里, 与做题记录在同一个事务中更新"""
+
+    def __init__(self, connection: sqlite3.Connection, lock: Optional[threading.RLock] = None):
+        self.connection = connection
+        self.lock = lock or threading.RLock()   # 与 HistoryStore 共用连接和锁
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS aggregates (
+                username TEXT NOT NULL,
+                opc TEXT NOT NULL,
+                fact TEXT NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (username, opc, fact)
+            )
+        ''')
+        self.cache: Dict[Tuple[str, str, str], Aggregate] = {}
+
+    def get(self, username: str, opc: str = ALL, fact: str = '') -> Aggregate:
+        key = (username, opc, fact)
+        aggregate = self.cache.get(key)
+        if aggregate is None:
+            with self.lock:
+                row = self.connection.execute('SELECT data FROM aggregates WHERE username = ? AND opc = ? AND fact = ?',
+                                              key).fetchone()
+            aggregate = self.cache[key] = Aggregate(json.loads(row[0]) if row else None)
+        return aggregate
+
+    def update(self, username: str, records: Iterable) -> None:
+        """调用方负责事务"""
+        changed = set()
+        for r in records:
+            for key in ((username, ALL, ''), (username, r.opc, ''), (username, r.opc, f'{r.value1}{r.opc}{r.value2}')):
+                self.get(*key).add(r.correct, r.latency, r.finish_at)
+                changed.add(key)
+        self.connection.executemany('INSERT OR REPLACE INTO aggregates VALUES (?, ?, ?, ?)',
+                                    [(*key, json.dumps(self.cache[key].to_json())) for key in changed])
+
+    def facts(self, username: str, opc: str) -> Dict[str, Aggregate]:
+        """该运算下每道题目的统计"""
+        with self.lock:
+            rows = self.connection.execute("SELECT fact, data FROM aggregates WHERE username = ? AND opc = ? AND fact != ''",
+                                           (username, opc)).fetchall()
+        result = {}
+        for fact, data in rows:   # 一次查询读出全部题目, 已缓存的以缓存为准
+            key = (username, opc, fact)
+            if key not in self.cache:
+                self.cache[key] = Aggregate(json.loads(data))
+            result[fact] = self.cache[key]
+        return result
+
+    def weakest(self, username: str, opc: str, n: int = 5) -> List[Tuple[str, Aggregate]]:
+        """错误最多的 n 道题目"""
+        facts = [(fact, a) for fact, a in self.facts(username, opc).items() if a.correct < a.total]
+        facts.sort(key=lambda x: (x[1].correct - x[1].total, x[1].accuracy))
+        return facts[:n]
+
+    def reset(self):
+        self.connection.execute('DELETE FROM aggregates')
+        self.cache.clear()
+
+    def invalidate(self):
+        """其他进程修改过数据库后丢弃缓存"""
+        self.cache.clear()
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+二进制题库: 每道题目是一条定长记录, 用 mmap 按序号直接读取, 不需要把题库读进内存.
+
+文件布局(小端):
+    头部    HEADER, 其后是生成时的 Config(JSON), 补齐到 8 字节
+    索引    entries 个 uint64, 第 k 项是前两个操作数为第 k 种组合的第一条记录的序号, 最后一项是记录总数
+    记录    count 条, 每条依次是 numbers 个操作数(H 或 i), numbers-1 个分隔符编码(SEPARATORS 里的下标),
+            numbers 个括号字节(高 4 位是操作数前的左括号数, 低 4 位是操作数后的右括号数), 1 个空格位置字节
+
+记录顺序与 test_generator 生成 CSV 的顺序相同, render 得到的文字也与 CSV 的一行完全相同.
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+from typing import Any, Dict, Iterator, List, Tuple, Union
+from expression import evaluate
+
+MAGIC = b'QBNK'
+VERSION = 1
+HEADER = struct.Struct('<4sHBcIIQQQ')   # magic, version, numbers, 操作数类型, 记录长度, 配置长度, 记录数, stride, 索引项数
+SEPARATORS = '=+-*/'
+INDEX = struct.Struct('<Q')
+Token = Union[int, str]
+
+
+def _align(n: int) -> int:
+    return (n + 7) & ~7
+
+
+def record_struct(numbers: int, typecode: str) -> struct.Struct:
+    return struct.Struct(f'<{numbers}{typecode}{numbers - 1}B{numbers}BB')
+
+
+def operand_typecode(config: Dict[str, Any]) -> str:
+    return 'H' if 0 <= config['value_min'] and config['value_max'] < 1 << 16 else 'i'
+
+
+def length_formula(config: Dict[str, Any]) -> int:
+    """与 test_generator.Config.length_formula 相同"""
+    numbers = config['numbers']
+    return numbers + len(str(config['value_max'])) * (numbers + 1) + (2 if config['bracket'] else 0)
+
+
+def encode(es: List[Token]) -> Tuple[List[int], List[int], List[int]]:
+    """把 get_question_list 使用的等式 (操作数、运算符、括号和等号) 拆成操作数、分隔符编码和括号字节"""
+    operands: List[int] = []
+    separators: List[int] = []
+    brackets: List[int] = []
+    opens = 0
+    for e in es:
+        if isinstance(e, int):
+            operands.append(e)
+            brackets.append(opens << 4)
+            opens = 0
+        elif e == '(':
+            opens += 1
+        elif e == ')':
+            brackets[-1] += 1
+        else:
+            separators.append(SEPARATORS.index(e))
+    return operands, separators, brackets
+
+
+def decode(operands: Tuple[int, ...], separators: Tuple[int, ...], brackets: Tuple[int, ...]) -> List[Token]:
+    es: List[Token] = []
+    for i, (value, bracket) in enumerate(zip(operands, brackets)):
+        if i:
+            es.append(SEPARATORS[separators[i - 1]])
+        es.extend('(' * (bracket >> 4))
+        es.append(value)
+        es.extend(')' * (bracket & 15))
+    return es
+
+
+class BankWriter:
+    """
+    按操作数组合的顺序写入: 对每个组合调用一次 write(序号, [(等式, 空格位置), ...]), 组合可以没有题目.
+    先写到临时文件, close 时补上索引和记录数再替换成正式文件.
+    """
+
+    def __init__(self, filename: str, config: Dict[str, Any], buffer_size: int = 1 << 20):
+        self.filename: str = filename
+        self.tmp: str = f'{filename}.tmp'
+        self.numbers: int = config['numbers']
+        self.typecode: str = operand_typecode(config)
+        self.record = record_struct(self.numbers, self.typecode)
+        size: int = config['value_max'] - config['value_min'] + 1
+        self.stride: int = size ** (self.numbers - 2)
+        self.index: List[int] = [0] * (size * size + 1)
+        self.config: bytes = json.dumps(config, ensure_ascii=False).encode('utf-8')
+        self.index_offset: int = _align(HEADER.size + len(self.config))
+        self.buffer_size: int = buffer_size
+        self.buffer = bytearray()
+        self.count: int = 0
+        self.entry: int = 0
+        self.file = open(self.tmp, 'wb')
+        self.file.write(bytes(self.index_offset + INDEX.size * len(self.index)))   # 头部和索引在 close 时写入
+
+    def write(self, index: int, questions: List[Tuple[List[Token], int]]):
+        while self.entry * self.stride <= index:
+            self.index[self.entry] = self.count
+            self.entry += 1
+        for es, blank in questions:
+            operands, separators, brackets = encode(es)
+            self.buffer += self.record.pack(*operands, *separators, *brackets, blank)
+        self.count += len(questions)
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.buffer)
+        self.buffer.clear()
+
+    def close(self):
+        self.flush()
+        for entry in range(self.entry, len(self.index)):
+            self.index[entry] = self.count
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, VERSION, self.numbers, self.typecode.encode('ascii'), self.record.size,
+                                    len(self.config), self.count, self.stride, len(self.index)))
+        self.file.write(self.config)
+        self.file.seek(self.index_offset)
+        self.file.write(b''.join(INDEX.pack(n) for n in self.index))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        os.replace(self.tmp, self.filename)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+            os.remove(self.tmp)
+
+
+class QuestionBank:
+    """只读的二进制题库, record/render 直接从 mmap 里按偏移解析, 打开文件的开销与题库大小无关"""
+
+    def __init__(self, filename: str):
+        self.filename: str = filename
+        with open(filename, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.mm) < HEADER.size:
+            self.mm.close()
+            raise ValueError(f'{filename}: not a question bank')
+        magic, version, self.numbers, typecode, record_size, config_length, self.count, self.stride, entries = \
+            HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.mm.close()
+            raise ValueError(f'{filename}: not a question bank (version {version})')
+        self.config: Dict[str, Any] = json.loads(self.mm[HEADER.size:HEADER.size + config_length].decode('utf-8'))
+        self.record = record_struct(self.numbers, typecode.decode('ascii'))
+        assert self.record.size == record_size, (self.record.size, record_size)
+        self.index_offset: int = _align(HEADER.size + config_length)
+        self.entries: int = entries
+        self.offset: int = self.index_offset + INDEX.size * entries
+        self.length_formula: int = length_formula(self.config)
+        self.key: str = hashlib.blake2b(self.mm[:self.offset], digest_size=6).hexdigest()   # 按头部、配置和索引区分题库
+
+    def __len__(self) -> int:
+        return self.count
+
+    def fields(self, i: int) -> Tuple[int, ...]:
+        """第 i 条记录的原始字段"""
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        return self.record.unpack_from(self.mm, self.offset + i * self.record.size)
+
+    def tokens(self, i: int) -> Tuple[List[Token], int]:
+        """(等式, 空格所在的操作数序号)"""
+        fields = self.fields(i)
+        n = self.numbers
+        return decode(fields[:n], fields[n:2 * n - 1], fields[2 * n - 1:3 * n - 1]), fields[-1]
+
+    def answer(self, i: int) -> int:
+        fields = self.fields(i)
+        return fields[fields[-1]]
+
+    def check(self, i: int, answer: int) -> bool:
+        """填入 answer 后等式是否成立; 有的题目不止一个答案, 例如 0=0/ _ /3"""
+        es, blank = self.tokens(i)
+        position = [j for j, e in enumerate(es) if isinstance(e, int)][blank]
+        es[position] = answer
+        equal = es.index('=')
+        left, right = evaluate(es[:equal]), evaluate(es[equal + 1:])
+        return left is not None and left == right
+
+    def parts(self, i: int) -> Tuple[str, str]:
+        """空格前后的文字, 例如 ('3+(', '-2)=7')"""
+        es, blank = self.tokens(i)
+        position = [j for j, e in enumerate(es) if isinstance(e, int)][blank]
+        return ''.join(map(str, es[:position])), ''.join(map(str, es[position + 1:]))
+
+    def render(self, i: int) -> str:
+        """与 CSV 题库里的一行相同: 空格用下划线补齐到 length_formula 个字符"""
+        left, right = self.parts(i)
+        return f'{left} {"_" * (self.length_formula - len(left) - len(right) - 2)} {right}'
+
+    def find(self, value1: int, value2: int) -> range:
+        """前两个操作数分别为 value1 和 value2 的记录序号范围"""
+        size = self.config['value_max'] - self.config['value_min'] + 1
+        k = (value1 - self.config['value_min']) * size + value2 - self.config['value_min']
+        if not 0 <= k < self.entries - 1:
+            return range(0)
+        start, stop = (INDEX.unpack_from(self.mm, self.index_offset + INDEX.size * j)[0] for j in (k, k + 1))
+        return range(start, stop)
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(self.count):
+            yield self.render(i)
+
+    def close(self):
+        self.mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+_banks: Dict[str, QuestionBank] = {}
+
+
+def open_bank(filename: str) -> QuestionBank:
+    """同一个文件只映射一次, 多次练习共用"""
+    bank = _banks.get(filename)
+    if bank is None or bank.mm.closed:
+        bank = _banks[filename] = QuestionBank(filename)
+    return bank
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+性能测试: python benchmark.py [--filter 名字] [--quick] [--save 基准.json] [--compare 基准.json]
+每项测试在临时目录里运行, 不需要显示器(Qt 使用 offscreen)和 wkhtmltopdf.
+--compare 时中位数比基准慢 threshold 以上的项目记为退步, 退出码为 1.
+"""
+import argparse
+import json
+import itertools
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Tuple, Union
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from expression import evaluate, get_templates
+
+
+def bench_evaluate(value_max: int = 20, numbers: int = 4, step: int = 97):
+    """对比 eval(stringify(...)) 与编译后的模板求值, 每 step 个操作数组合取一个样本"""
+    operates = ('+', '-')
+    values: List[int] = list(range(0, value_max + 1))
+    samples = []
+    for vs in itertools.islice(itertools.product(*[values] * numbers), 0, None, step):
+        for n in range(1, numbers):
+            for part in (list(vs[:n]), list(vs[n:])):
+                samples.append(part)
+    expressions: List[List[Union[int, str]]] = []
+    for part in samples:
+        for template in get_templates(len(part), operates, numbers > 3):
+            expressions.append(template.tokens(part))
+
+    start = time.perf_counter()
+    expected = [eval(''.join(str(e) for e in tokens)) for tokens in expressions]
+    elapsed_eval = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = [evaluate(tokens) for tokens in expressions]
+    elapsed_tokens = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for part in samples:
+        for template in get_templates(len(part), operates, numbers > 3):
+            template.evaluate(part)
+    elapsed_template = time.perf_counter() - start
+
+    assert expected == actual
+    print(f'numbers={numbers} value_max={value_max} expressions={len(expressions)}')
+    print(f'  eval(stringify):   {elapsed_eval:8.3f}s')
+    print(f'  evaluate(tokens):  {elapsed_tokens:8.3f}s  x{elapsed_eval / elapsed_tokens:0.1f}')
+    print(f'  Template.evaluate: {elapsed_template:8.3f}s  x{elapsed_eval / elapsed_template:0.1f}')
+
+
+CONFIGS: Dict[str, Dict[str, Any]] = {
+    'small': dict(value_min=0, value_max=10, numbers=3, operates=['+', '-'], bracket=False),
+    'medium': dict(value_min=0, value_max=20, numbers=3, operates=['+', '-', '*', '/'], bracket=False),
+    'large': dict(value_min=0, value_max=9, numbers=4, operates=['+', '-'], bracket=True),
+}
+HISTORY_SIZES: List[int] = [0, 10000, 100000]
+RANGES: Dict[str, Tuple[str, List[int]]] = {
+    'add-small': ('+', [1, 9, 1, 9, 0, 18]),
+    'mul-large': ('*', [0, 300, 0, 300, 0, 90000]),
+}
+BENCHMARKS: Dict[str, Tuple[Callable[[Any], Callable[[], Any]], List[Any]]] = {}
+
+
+def benchmark(*params):
+    """注册一项测试: 函数接收一个参数, 做好准备后返回要计时的无参函数"""
+    def decorator(function):
+        BENCHMARKS[function.__name__[len('bench_'):]] = (function, list(params))
+        return function
+    return decorator
+
+
+def run_timed(run: Callable[[], Any], number: int) -> float:
+    """number 次调用的总耗时; run 带有 setup 属性时每次调用前先执行 setup, 不计入耗时"""
+    setup = getattr(run, 'setup', None)
+    if setup is None:
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        return time.perf_counter() - start
+    elapsed = 0.0
+    for _ in range(number):
+        setup()
+        start = time.perf_counter()
+        run()
+        elapsed += time.perf_counter() - start
+    return elapsed
+
+
+def measure(run: Callable[[], Any], repeat: int = 5, min_time: float = 0.05) -> Dict[str, float]:
+    """每轮至少运行 min_time 秒, 返回每次调用耗时的最小值和中位数"""
+    number, elapsed = 1, 0.0
+    while True:   # 确定每轮的调用次数
+        elapsed = run_timed(run, number)
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed <= 0 else max(2, min(10, int(min_time / elapsed) + 1))
+    times = [elapsed / number]
+    for _ in range(repeat - 1):
+        times.append(run_timed(run, number) / number)
+    return {'min': min(times), 'median': statistics.median(times), 'number': number}
+
+
+def make_history(filename: str, size: int, seed: int = 0):
+    from history import HistoryStore, TestRecord
+    r = random.Random(seed)
+    store = HistoryStore(filename)
+    records = []
+    for i in range(size):
+        x, y = r.randint(1, 9), r.randint(1, 9)
+        answer = x + y if r.random() < 0.8 else x + y + 1
+        records.append(TestRecord(x, '+', y, answer, x + y, answer == x + y, r.uniform(0.5, 5), i, i + 1))
+    store.append('bench', records)
+    return store
+
+
+@benchmark(*CONFIGS)
+def bench_generate_one(name: str):
+    from test_generator import Config, generate_one
+    Config.restore(CONFIGS[name])
+    return lambda: sum(1 for _ in generate_one())
+
+
+@benchmark(3, 4)
+def bench_slice_table(numbers: int):
+    """generate_equations 的子表达式计算: 在新的 SliceTable 上对 1000 个片段求出全部非负的带括号表达式"""
+    from expression import SliceTable
+    r = random.Random(numbers)
+    parts = [tuple(r.randint(0, 20) for _ in range(numbers)) for _ in range(1000)]
+    operates = ('+', '-', '*', '/')
+    return lambda: [SliceTable(operates, True).get(part) for part in parts]
+
+
+@benchmark(*RANGES)
+def bench_sampler_build(name: str):
+    from sampler import AdaptiveSampler, PairSampler
+    opc, ranges = RANGES[name]
+    return lambda: AdaptiveSampler(PairSampler(opc, tuple(ranges)), {})
+
+
+@benchmark(*RANGES)
+def bench_session_next(name: str):
+    from session import OperationType, Session, Setting
+    opc, ranges = RANGES[name]
+    operation = next(op for op in OperationType if op.value[1] == opc)
+    Setting.save_range('bench', operation.name, ranges)
+    session = Session('bench', operation, 60)
+    return lambda: [session.next() for _ in range(100)]
+
+
+@benchmark(*RANGES)
+def bench_playground_next(name: str):
+    """PlayGround.next 包括设置控件的值"""
+    from PyQt5.QtWidgets import QApplication, QDialog
+    from main import PlayGround
+    from session import OperationType, Setting
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    opc, ranges = RANGES[name]
+    parent = QDialog()
+    parent.username = 'bench'
+    parent.operation = next(op for op in OperationType if op.value[1] == opc)
+    Setting.save_range('bench', parent.operation.name, ranges)
+    playground = PlayGround(parent=parent, seconds=3600)
+    playground.killTimer(playground.timer)
+
+    def run():
+        for _ in range(100):
+            playground.next()
+        app.processEvents()
+    run.keep = (parent, playground)
+    return run
+
+
+@benchmark('load', 'save')
+def bench_setting_range(action: str):
+    from session import Setting
+    Setting.save_range('bench', 'ADDITION', [1, 9, 1, 9, 0, 18])
+    if action == 'load':
+        return lambda: [Setting.load_range('bench', 'ADDITION') for _ in range(100)]
+    return lambda: [Setting.save_range('bench', 'ADDITION', [1, 9, 1, 9, 0, i]) for i in range(100)]
+
+
+@benchmark(*HISTORY_SIZES)
+def bench_score_persistence(size: int):
+    """在已有 size 条记录的数据库里保存一次 60 道题的成绩, 每次都从同样的 size 条记录开始"""
+    from history import HistoryStore, TestRecord
+    template = f'history_{size}.db'
+    make_history(template, size).close()
+    tests = [TestRecord(i % 9 + 1, '+', i % 7 + 1, 0, 0, i % 3 > 0, 1.5, i, i + 1) for i in range(60)]
+    stores = []
+
+    def setup():
+        if stores:
+            stores.pop().close()
+        shutil.copyfile(template, f'run_{template}')
+        stores.append(HistoryStore(f'run_{template}'))
+
+    def run():
+        stores[-1].append('bench', tests)
+    run.setup = setup
+    return run
+
+
+@benchmark(*HISTORY_SIZES)
+def bench_score_report(size: int):
+    """成绩页面的历史统计"""
+    store = make_history(f'report_{size}.db', size)
+    return lambda: (store.analytics.get('bench', '+').latency.quantile(0.9), store.analytics.weakest('bench', '+'))
+
+
+@benchmark('small', 'medium')
+def bench_generate_html(name: str):
+    from test_generator import Config, generate_csv, generate_html
+    Config.restore(CONFIGS[name])
+    filename = generate_csv()
+    return lambda: generate_html(filename, backend='python')
+
+
+@benchmark('large')
+def bench_bank_next(name: str):
+    """从二进制题库出题并渲染显示的文字"""
+    from session import BankSession
+    from test_generator import Config, generate_csv
+    Config.restore(CONFIGS[name])
+    session = BankSession('bench', generate_csv(format='bin'), 60, random.Random(0))
+    return lambda: [(session.next(), session.parts()) for _ in range(100)]
+
+
+def run_benchmarks(pattern: str = '', quick: bool = False) -> Dict[str, Dict[str, float]]:
+    from loguru import logger
+    from test_generator import Config
+    logger.remove()   # DEBUG 日志不计入耗时
+    logger.add(sys.stderr, level='INFO')
+    results = {}
+    snapshot = Config.snapshot()
+    for name, (function, params) in BENCHMARKS.items():
+        if pattern not in name:
+            continue
+        for param in params[:2] if quick else params:
+            key = f'{name}[{param}]'
+            run = function(param)
+            results[key] = measure(run, repeat=3 if quick else 5)
+            print(f'{key:<40} {results[key]["median"] * 1000:10.3f}ms  (min {results[key]["min"] * 1000:.3f}ms)')
+            Config.restore(snapshot)
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], threshold: float) -> List[str]:
+    """比基准慢 threshold 以上的项目"""
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        ratio = result['median'] / baseline[key]['median']
+        flag = 'REGRESSION' if ratio > 1 + threshold else 'faster' if ratio < 1 - threshold else ''
+        print(f'{key:<40} x{ratio:6.2f} {flag}')
+        if flag == 'REGRESSION':
+            regressions.append(key)
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--filter', default='', help='只运行名字包含该字符串的测试')
+    parser.add_argument('--quick', action='store_true', help='每项只测前两个参数, 轮数减少')
+    parser.add_argument('--save', metavar='FILE', help='把结果保存为基准')
+    parser.add_argument('--compare', metavar='FILE', help='与基准比较')
+    parser.add_argument('--threshold', type=float, default=0.2, help='慢多少算退步')
+    parser.add_argument('--evaluate', action='store_true', help='运行 eval 与编译求值的对比')
+    args = parser.parse_args()
+    if args.evaluate:
+        bench_evaluate()
+        raise SystemExit(0)
+    save = os.path.abspath(args.save) if args.save else None
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)   # 题库、设置和历史数据库都写在临时目录
+        try:
+            results = run_benchmarks(args.filter, args.quick)
+            from settings import get_store
+            get_store().flush()
+        finally:
+            os.chdir(cwd)
+    if save:
+        from writer import atomic_write
+        data = {'python': sys.version.split()[0], 'platform': sys.platform, 'time': time.time(), 'results': results}
+        atomic_write(save, json.dumps(data, indent=1).encode('utf-8'))
+    if baseline is not None and compare(results, baseline, args.threshold):
+        raise SystemExit(1)
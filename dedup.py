@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+题目去重: 把题目化成规范形式, 只保留每种规范形式第一次出现的题目.
+
+规范形式: 空格(填空处)记为 ?, 连续的加减合并成一组带符号的项, 连续的乘除合并成一组因子, 组内排序;
+开头或跟在 + * 后面的括号随之消失, 跟在 - / 后面的括号整体作为一项保留(组内同样排序); 等号两边排序.
+所以 3+5=_、5+3=_、_=3+5、(3+5)=_ 是同一道题目, 而 3+5=_ 与 8-5=_ 不是, 8-(5-2)=_ 与 8-5+2=_ 也不是.
+
+去重表只保存规范形式的 64 位哈希(set), 或者用 Bloom 过滤器把内存限制在固定大小(有很小的误删概率).
+"""
+import hashlib
+import math
+import re
+from typing import Iterable, List, Tuple, Union
+
+TOKEN = re.compile(r'\d+|_+|[-+*/×÷()=]')
+MULTIPLY = ('*', '/', '×', '÷')
+Node = Union[str, Tuple[str, List[str], List[str]]]   # 数字/空格, 或 ('+', 正项, 负项), ('*', 分子, 分母)
+
+
+class _Parser:
+    """sum := term (('+'|'-') term)*, term := factor (('*'|'/') factor)*, factor := 数 | ? | '(' sum ')'"""
+
+    def __init__(self, tokens: List[str]):
+        self.tokens: List[str] = tokens
+        self.position: int = 0
+
+    def peek(self) -> str:
+        return self.tokens[self.position] if self.position < len(self.tokens) else ''
+
+    def take(self) -> str:
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def parse_sum(self) -> Node:
+        node = self.parse_term()
+        if self.peek() not in ('+', '-'):
+            return node   # 只有一项, 保留结构以便在外层乘除里展开
+        positive, negative = [], []
+        sign = '+'
+        while True:
+            if sign == '+' and isinstance(node, tuple) and node[0] == '+':   # + 后面括号里的加减展开
+                positive.extend(node[1])
+                negative.extend(node[2])
+            else:
+                (positive if sign == '+' else negative).append(key(node))
+            if self.peek() not in ('+', '-'):
+                break
+            sign = self.take()
+            node = self.parse_term()
+        return '+', positive, negative
+
+    def parse_term(self) -> Node:
+        node = self.parse_factor()
+        if self.peek() not in MULTIPLY:
+            return node   # 只有一个因子
+        numerator, denominator = [], []
+        operator = '*'
+        while True:
+            if operator == '*' and isinstance(node, tuple) and node[0] == '*':   # * 后面括号里的乘除展开
+                numerator.extend(node[1])
+                denominator.extend(node[2])
+            else:
+                (numerator if operator == '*' else denominator).append(key(node))
+            if self.peek() not in MULTIPLY:
+                break
+            operator = '*' if self.take() in ('*', '×') else '/'
+            node = self.parse_factor()
+        return '*', numerator, denominator
+
+    def parse_factor(self) -> Node:
+        token = self.take()
+        if token == '(':
+            node = self.parse_sum()
+            if self.take() != ')':
+                raise ValueError(self.tokens)
+            return node
+        if token.startswith('_'):
+            return '?'
+        if token.isdigit():
+            return str(int(token))
+        raise ValueError(self.tokens)
+
+
+def key(node: Node) -> str:
+    if isinstance(node, str):
+        return node
+    operator, positive, negative = node
+    inverse = '-' if operator == '+' else '/'
+    text = operator.join(sorted(positive))
+    if negative:
+        text += inverse + inverse.join(sorted(negative))
+    return f'({text})'
+
+
+def canonical(question: str) -> str:
+    """题目的规范形式, 例如 ' _ =5+3' 与 '3+5= _ ' 都是 '(3+5)=?'"""
+    tokens = TOKEN.findall(question)
+    position = tokens.index('=')
+    sides = []
+    for part in (tokens[:position], tokens[position + 1:]):
+        parser = _Parser(part)
+        node = parser.parse_sum()
+        if parser.position != len(part):
+            raise ValueError(question)
+        sides.append(key(node))
+    return '='.join(sorted(sides))
+
+
+class DigestSet:
+    """规范形式的 64 位哈希集合"""
+
+    def __init__(self):
+        self.digests = set()
+
+    def add(self, digest: bytes) -> bool:
+        """新的返回 True"""
+        value = int.from_bytes(digest[:8], 'little')
+        if value in self.digests:
+            return False
+        self.digests.add(value)
+        return True
+
+    def __len__(self) -> int:
+        return len(self.digests)
+
+
+class BloomFilter:
+    """capacity 个元素时误判率约为 error_rate, 内存 -capacity·ln(error_rate)/ln(2)² 位"""
+
+    def __init__(self, capacity: int, error_rate: float = 1e-6):
+        self.size: int = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes: int = max(1, round(self.size / max(1, capacity) * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count: int = 0
+
+    def add(self, digest: bytes) -> bool:
+        """新的返回 True; 已经出现过的一定返回 False, 新的以很小的概率误判为出现过"""
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:16], 'little') | 1
+        new = False
+        for i in range(self.hashes):   # 双重哈希
+            bit = (h1 + i * h2) % self.size
+            byte, mask = bit >> 3, 1 << (bit & 7)
+            if not self.bits[byte] & mask:
+                self.bits[byte] |= mask
+                new = True
+        self.count += new
+        return new
+
+    def __len__(self) -> int:
+        return self.count
+
+
+class Deduplicator:
+    """流式去重, method 为 set 或 bloom(需要预计的题目数 capacity)"""
+
+    def __init__(self, method: str = 'set', capacity: int = 0, error_rate: float = 1e-6):
+        assert method in ('set', 'bloom'), method
+        self.method: str = method
+        self.seen = DigestSet() if method == 'set' else BloomFilter(capacity, error_rate)
+        self.total: int = 0
+        self.dropped: int = 0
+
+    def add(self, question: str) -> bool:
+        """题目的规范形式第一次出现时返回 True"""
+        digest = hashlib.blake2b(canonical(question).encode('utf-8'), digest_size=16).digest()
+        self.total += 1
+        if self.seen.add(digest):
+            return True
+        self.dropped += 1
+        return False
+
+    def filter(self, questions: Iterable[str]) -> List[str]:
+        return [question for question in questions if self.add(question)]
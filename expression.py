@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+import collections
+import functools
+import itertools
+from fractions import Fraction
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+Token = Union[int, str]
+Value = Union[int, Fraction]
+Shape = Tuple[Optional[str], ...]   # 表达式结构: 数字位置为 None, 其余为运算符或括号
+
+
+def divide(a: Value, b: Value) -> Value:
+    """精确除法, 整除时返回 int"""
+    q = Fraction(a, b)
+    return q.numerator if q.denominator == 1 else q
+
+
+def get_shape(tokens: Sequence[Token]) -> Shape:
+    return tuple(None if isinstance(t, int) else t for t in tokens)
+
+
+class _Parser:
+    """把表达式结构翻译成 Python 源码, 运算顺序与 eval 相同, 除法改为精确的 divide"""
+
+    def __init__(self, shape: Shape, offset: int):
+        self.shape = shape
+        self.position = 0
+        self.operand = offset
+
+    def parse(self) -> str:
+        source = self.expression()
+        assert self.position == len(self.shape), self.shape
+        return source
+
+    def peek(self) -> Optional[str]:
+        return self.shape[self.position] if self.position < len(self.shape) else ''
+
+    def expression(self) -> str:
+        source = self.term()
+        while self.peek() in ('+', '-'):
+            operate = self.shape[self.position]
+            self.position += 1
+            source = f'({source}{operate}{self.term()})'
+        return source
+
+    def term(self) -> str:
+        source = self.factor()
+        while self.peek() in ('*', '/'):
+            operate = self.shape[self.position]
+            self.position += 1
+            if operate == '/':
+                source = f'divide({source},{self.factor()})'
+            else:
+                source = f'({source}*{self.factor()})'
+        return source
+
+    def factor(self) -> str:
+        token = self.peek()
+        self.position += 1
+        if token is None:
+            self.operand += 1
+            return f'v[{self.operand - 1}]'
+        assert token == '(', self.shape
+        source = self.expression()
+        assert self.peek() == ')', self.shape
+        self.position += 1
+        return source
+
+
+_compiled: Dict[Tuple[Shape, int], Callable[[Sequence[int]], Value]] = {}
+
+
+def get_source(shape: Shape, offset: int = 0) -> str:
+    """表达式结构对应的 Python 源码, 操作数写作 v[i], 除法写作 divide(a,b)"""
+    return _Parser(shape, offset).parse()
+
+
+def compile_shape(shape: Shape, offset: int = 0) -> Callable[[Sequence[int]], Value]:
+    """每种表达式结构只编译一次, 返回的函数按下标从 v[offset] 开始取操作数"""
+    key = (shape, offset)
+    function = _compiled.get(key)
+    if function is None:
+        function = _compiled[key] = eval(f'lambda v: {get_source(shape, offset)}', {'divide': divide})
+    return function
+
+
+def evaluate(tokens: Sequence[Token]) -> Optional[Value]:
+    """计算表达式的精确值, 除数为 0 时返回 None"""
+    function = compile_shape(get_shape(tokens))
+    try:
+        return function([t for t in tokens if isinstance(t, int)])
+    except ZeroDivisionError:
+        return None
+
+
+class Template:
+    """运算模板: 运算符序列加上可选的一对括号(括住第 i 到第 j 个操作数)"""
+    __slots__ = ('operates', 'bracket', 'shape', 'function', 'inner')
+
+    def __init__(self, operates: Tuple[str, ...], bracket: Optional[Tuple[int, int]] = None):
+        self.operates: Tuple[str, ...] = operates
+        self.bracket: Optional[Tuple[int, int]] = bracket
+        self.shape: Shape = get_shape(self.tokens([0] * (len(operates) + 1)))
+        self.function = compile_shape(self.shape)
+        self.inner = None
+        if bracket is not None:
+            i, j = bracket
+            self.inner = compile_shape(get_shape(self.tokens([0] * (len(operates) + 1))[2 * i + 1: 2 * j + 2]), offset=i)
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self.operates!r}, {self.bracket!r})'
+
+    def tokens(self, values: Sequence[int]) -> List[Token]:
+        result: List[Token] = [values[0]]
+        for operate, value in zip(self.operates, values[1:]):
+            result.append(operate)
+            result.append(value)
+        if self.bracket is not None:
+            i, j = self.bracket
+            result.insert(2 * j + 1, ')')
+            result.insert(2 * i, '(')
+        return result
+
+    def evaluate(self, values: Sequence[int]) -> Optional[Value]:
+        """计算模板的值; 括号里的结果小于 0 或除数为 0 时返回 None"""
+        try:
+            if self.inner is not None and self.inner(values) < 0:
+                return None
+            return self.function(values)
+        except ZeroDivisionError:
+            return None
+
+
+@functools.lru_cache(maxsize=None)
+def get_templates(numbers: int, operates: Tuple[str, ...], bracket: bool) -> List[Template]:
+    """numbers 个操作数的全部模板: 按运算符组合排列, 每种组合先是不带括号的, 再按括号位置排列"""
+    result: List[Template] = []
+    for ops in itertools.product(*[operates] * (numbers - 1)):
+        result.append(Template(ops))
+        if bracket:
+            for i, j in itertools.product(range(0, numbers - 1), range(1, numbers)):
+                if i < j and j - i < numbers - 1:
+                    result.append(Template(ops, (i, j)))
+    return result
+
+
+class SubExpressions(NamedTuple):
+    forms: List[Tuple[Template, Value]]    # 按模板顺序排列的非负表达式
+    index: Dict[Value, List[Template]]     # 按结果分组
+
+
+class SliceTable:
+    """操作数片段 -> 非负子表达式的记忆表, 同一片段在一次生成中只计算一次, 超过 maxsize 时淘汰最久未用的片段"""
+
+    def __init__(self, operates: Tuple[str, ...], bracket: bool, maxsize: int = 2 ** 18):
+        self.operates: Tuple[str, ...] = operates
+        self.bracket: bool = bracket
+        self.maxsize: int = maxsize
+        self.cache: 'collections.OrderedDict[Tuple[int, ...], SubExpressions]' = collections.OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def __len__(self) -> int:
+        return len(self.cache)
+
+    def get(self, part: Tuple[int, ...]) -> SubExpressions:
+        result = self.cache.get(part)
+        if result is not None:
+            self.hits += 1
+            self.cache.move_to_end(part)
+            return result
+        self.misses += 1
+        result = SubExpressions([], {})
+        for template in get_templates(len(part), self.operates, self.bracket):
+            value = template.evaluate(part)
+            if value is not None and value >= 0:   # 结果小于 0 的不保留
+                result.forms.append((template, value))
+                result.index.setdefault(value, []).append(template)
+        self.cache[part] = result
+        if len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+        return result
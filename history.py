@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+import dbm
+import shelve
+import sqlite3
+import threading
+from analytics import Analytics
+from loguru import logger
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+HISTORY = 'history.db'
+
+
+class TestRecord(NamedTuple):
+    value1: int
+    opc: str       # + - * /, 题库练习为 # 加题库标识
+    value2: int
+    answer: int
+    ref: int
+    correct: bool
+    latency: float   # 秒
+    start_at: float
+    finish_at: float
+
+
+class HistoryStore:
+    """
+    做题记录: SQLite WAL 模式, 每道题一行, 追加的开销与历史长度无关.
+    按 (用户, 运算, 开始时间) 建索引.
+    同一进程内的线程共用一个连接, 由 lock 串行化; 多个进程写同一个文件时用 BEGIN IMMEDIATE 排队,
+    并根据 data_version 发现其他进程的写入, 丢弃过期的累计统计缓存.
+    """
+
+    def __init__(self, filename: str = HISTORY, legacy: Optional[str] = None):
+        self.filename: str = filename
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(filename, timeout=30, check_same_thread=False, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS tests (
+                id INTEGER PRIMARY KEY,
+                username TEXT NOT NULL,
+                opc TEXT NOT NULL,
+                value1 INTEGER NOT NULL,
+                value2 INTEGER NOT NULL,
+                answer INTEGER NOT NULL,
+                ref INTEGER NOT NULL,
+                correct INTEGER NOT NULL,
+                latency REAL NOT NULL,
+                start_at REAL NOT NULL,
+                finish_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS tests_username ON tests (username, opc, start_at);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        ''')
+        self.analytics = Analytics(self.connection, self.lock)
+        self.data_version: int = self.get_data_version()
+        if not self.has_marker('aggregates'):
+            self.rebuild(force=False)
+        if legacy is not None:
+            self.migrate(legacy)
+
+    def has_marker(self, key: str) -> bool:
+        return self.connection.execute('SELECT 1 FROM meta WHERE key = ?', (key,)).fetchone() is not None
+
+    def rebuild(self, force: bool = True):
+        """由全部做题记录重新计算累计统计; force 为 False 时已经算过(可能是其他进程)就不再计算"""
+        with self.lock:
+            self.begin()
+            if not force and self.has_marker('aggregates'):   # 在写事务里再检查一次
+                self.connection.execute('ROLLBACK')
+                return
+            try:
+                self.analytics.reset()
+                for username, in self.connection.execute('SELECT DISTINCT username FROM tests').fetchall():
+                    self.analytics.update(username, self.query(username))
+                self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('aggregates', '1')")
+                self.connection.execute('COMMIT')
+            except Exception:
+                self.rollback()
+                raise
+
+    def migrate(self, legacy: str):
+        """
+        把旧 shelve 数据库里的 {username}/tests 导入一次. 格式不对的记录跳过;
+        shelve 打不开(被锁住或损坏)时不做标记, 下次启动再导入.
+        """
+        with self.lock:
+            if self.has_marker('migrated'):
+                return
+            imported = skipped = 0
+            self.begin()
+            if self.has_marker('migrated'):   # 其他进程在 BEGIN IMMEDIATE 之前已经导入
+                self.connection.execute('ROLLBACK')
+                return
+            try:
+                if dbm.whichdb(legacy) is not None:   # None: 没有旧数据库
+                    with shelve.open(legacy, flag='r') as db:
+                        for key in db.keys():
+                            if not key.endswith('/tests'):
+                                continue
+                            records, bad = self.read_legacy(db, key)
+                            self.append(key[:-len('/tests')], records, commit=False)
+                            imported += len(records)
+                            skipped += bad
+                self.connection.execute("INSERT INTO meta VALUES ('migrated', ?)", (legacy,))
+                self.connection.execute('COMMIT')
+            except Exception as e:
+                self.rollback()
+                logger.warning(f'migrate {legacy} failed, will retry on next start: {e!r}')
+                return
+            logger.info(f'migrate {imported} tests from {legacy} to {self.filename}')
+            if skipped:
+                logger.warning(f'migrate: {skipped} malformed tests in {legacy} skipped')
+
+    @staticmethod
+    def read_legacy(db: shelve.Shelf, key: str) -> Tuple[List[TestRecord], int]:
+        """(能解析的记录, 跳过的记录数)"""
+        try:
+            values = list(db[key])
+        except Exception as e:
+            logger.warning(f'migrate: skip [{key}]: {e!r}')
+            return [], 1
+        records: List[TestRecord] = []
+        for value in values:
+            try:
+                value1, opc, oph, value2, answer, ref, correct, (t, t1, t2) = value
+                records.append(TestRecord(int(value1), str(opc), int(value2), int(answer), int(ref), bool(correct),
+                                          float(t), float(t1), float(t2)))
+            except (TypeError, ValueError) as e:
+                logger.warning(f'migrate: skip [{key}] {value!r}: {e!r}')
+        return records, len(values) - len(records)
+
+    def get_data_version(self) -> int:
+        return self.connection.execute('PRAGMA data_version').fetchone()[0]
+
+    def begin(self):
+        """开始写事务, 其他进程的写入会在此之前提交完"""
+        self.connection.execute('BEGIN IMMEDIATE')
+        version = self.get_data_version()
+        if version != self.data_version:
+            self.data_version = version
+            self.analytics.invalidate()
+
+    def rollback(self):
+        """放弃当前事务; 累计统计的缓存已经按未提交的记录更新过, 一并丢弃"""
+        with self.lock:
+            if self.connection.in_transaction:
+                self.connection.execute('ROLLBACK')
+            self.analytics.invalidate()
+
+    def append(self, username: str, records: Iterable[TestRecord], commit: bool = True):
+        """追加记录并在同一个事务中更新累计统计; 出错时回滚整个事务"""
+        records = list(records)
+        with self.lock:
+            if not self.connection.in_transaction:
+                self.begin()
+            try:
+                self.connection.executemany(
+                    'INSERT INTO tests (username, opc, value1, value2, answer, ref, correct, latency, start_at, finish_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    [(username, r.opc, r.value1, r.value2, r.answer, r.ref, int(r.correct), r.latency, r.start_at,
+                      r.finish_at) for r in records])
+                self.analytics.update(username, records)
+                if commit:
+                    self.connection.execute('COMMIT')
+            except Exception:
+                self.rollback()
+                raise
+
+    def query(self, username: str, opc: Optional[str] = None, since: float = 0) -> Iterator[TestRecord]:
+        sql = 'SELECT value1, opc, value2, answer, ref, correct, latency, start_at, finish_at FROM tests ' \
+              'WHERE username = ? AND start_at >= ?'
+        args: List = [username, since]
+        if opc is not None:
+            sql += ' AND opc = ?'
+            args.append(opc)
+        with self.lock:
+            rows = self.connection.execute(sql + ' ORDER BY start_at', args).fetchall()
+        for value1, opc, value2, answer, ref, correct, latency, start_at, finish_at in rows:
+            yield TestRecord(value1, opc, value2, answer, ref, bool(correct), latency, start_at, finish_at)
+
+    def count(self, username: str, opc: Optional[str] = None) -> int:
+        with self.lock:
+            if opc is None:
+                return self.connection.execute('SELECT COUNT(*) FROM tests WHERE username = ?', (username,)).fetchone()[0]
+            return self.connection.execute('SELECT COUNT(*) FROM tests WHERE username = ? AND opc = ?',
+                                           (username, opc)).fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+_history: Optional[HistoryStore] = None
+_history_lock = threading.Lock()
+
+
+def get_history(legacy: Optional[str] = None) -> HistoryStore:
+    """进程内只打开一次, 多个线程同时第一次调用时也只创建一个"""
+    global _history
+    if _history is None:
+        with _history_lock:
+            if _history is None:
+                _history = HistoryStore(legacy=legacy)
+    return _history
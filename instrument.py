@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+界面耗时统计: 设置环境变量 CALCULATOR_PROFILE=<文件名> 后启用, 退出时把各项耗时的直方图写成 JSON.
+未启用时 span 返回同一个空的上下文管理器, timed 原样返回函数, record 直接返回.
+main.py 启动时最先导入这个模块, 所以这里只导入标准库, 其他模块用到时才导入.
+"""
+import atexit
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+PROFILE: Optional[str] = os.environ.get('CALCULATOR_PROFILE') or None
+enabled: bool = PROFILE is not None
+now: Callable[[], int] = time.perf_counter_ns
+
+
+class Histogram:
+    """一项耗时的分布, 单位纳秒"""
+
+    def __init__(self, name: str):
+        from analytics import QuantileSketch
+        self.name: str = name
+        self.sketch = QuantileSketch(accuracy=0.01)
+        self.total: int = 0
+        self.maximum: int = 0
+
+    def record(self, ns: int):
+        self.sketch.add(ns)
+        self.total += ns
+        self.maximum = max(self.maximum, ns)
+
+    def to_json(self) -> Dict:
+        count = self.sketch.count
+        return {
+            'count': count,
+            'mean_us': self.total / count / 1000 if count else 0.0,
+            'p50_us': self.sketch.quantile(0.5) / 1000,
+            'p90_us': self.sketch.quantile(0.9) / 1000,
+            'p99_us': self.sketch.quantile(0.99) / 1000,
+            'max_us': self.maximum / 1000,
+            'sketch': self.sketch.to_json(),
+        }
+
+
+histograms: Dict[str, Histogram] = {}
+
+
+def record(name: str, ns: int):
+    if not enabled:
+        return
+    histogram = histograms.get(name)
+    if histogram is None:
+        histogram = histograms[name] = Histogram(name)
+    histogram.record(ns)
+
+
+class _Span:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name: str):
+        self.name: str = name
+        self.start: int = 0
+
+    def __enter__(self):
+        self.start = now()
+        return self
+
+    def __exit__(self, *args):
+        record(self.name, now() - self.start)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+_null_span = _NullSpan()
+
+
+def span(name: str):
+    """with span('next'): ... 记录代码块的耗时"""
+    return _Span(name) if enabled else _null_span
+
+
+def timed(name: str):
+    """记录函数耗时的装饰器"""
+    def decorator(function):
+        if not enabled:
+            return function
+
+        def wrapper(*args, **kwargs):
+            start = now()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(name, now() - start)
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        return wrapper
+    return decorator
+
+
+def export(filename: Optional[str] = None):
+    from loguru import logger
+    from writer import atomic_write
+    filename = filename or PROFILE
+    if not filename or not histograms:
+        return
+    data = {name: histograms[name].to_json() for name in sorted(histograms)}
+    atomic_write(filename, json.dumps(data, ensure_ascii=False, indent=1).encode('utf-8'))
+    for name, h in data.items():
+        logger.info(f'{name}: n={h["count"]} p50={h["p50_us"]:.0f}us p99={h["p99_us"]:.0f}us max={h["max_us"]:.0f}us')
+
+
+class Startup:
+    """启动各阶段的耗时, 从创建时开始计时"""
+
+    def __init__(self):
+        self.started: int = now()
+        self.marks: List[Tuple[str, int]] = []
+
+    def mark(self, name: str):
+        self.marks.append((name, now()))
+
+    def to_json(self) -> Dict:
+        phases, last = [], self.started
+        for name, ns in self.marks:
+            phases.append({'name': name, 'ms': (ns - last) / 1e6, 'at_ms': (ns - self.started) / 1e6})
+            last = ns
+        return {'total_ms': (last - self.started) / 1e6, 'modules': len(sys.modules), 'phases': phases}
+
+    def report(self, filename: Optional[str] = None):
+        from loguru import logger
+        data = self.to_json()
+        for phase in data['phases']:
+            logger.info(f'startup: {phase["name"]:<24} {phase["ms"]:8.1f}ms {phase["at_ms"]:8.1f}ms')
+        logger.info(f'startup: total {data["total_ms"]:.1f}ms, {data["modules"]} modules')
+        if filename:
+            from writer import atomic_write
+            atomic_write(filename, json.dumps(data, ensure_ascii=False, indent=1).encode('utf-8'))
+
+
+if enabled:
+    import loguru   # 先于 export 注册 loguru 的退出处理, 退出时 export 的日志才能输出
+    atexit.register(export)
@@ -1,84 +1,106 @@
 # -*- coding: utf-8 -*-
-import enum
-import random
-import shelve
-import statistics
-import time
-from PyQt5.QtCore import *
-from PyQt5.QtWidgets import *
-from typing import Dict, List
-from loguru import logger
-
-
-DB = 'database'
-
-
-class OperationType(enum.Enum):
-    ADDITION = ('+', '+')
-    SUBTRACTION = ('-', '-')
-    MULTIPLICATION = ('×', '*')
-    DIVISION = ('÷', '/')
+"""
+启动时只导入 PyQt5 和 instrument, 登录窗口显示之后再在空闲时导入 session(以及 loguru、sqlite3 等).
+python main.py --startup-report [文件名] 输出各阶段的启动耗时.
+"""
+import functools
+import importlib.util
+import instrument
+startup = instrument.Startup()
+from PyQt5.QtCore import QEvent, QTimer, QUrl, Qt, pyqtSignal
+startup.mark('import PyQt5.QtCore')
+from PyQt5.QtWidgets import (QAbstractSpinBox, QApplication, QCheckBox, QComboBox, QDialog, QFileDialog, QGridLayout,
+                             QHBoxLayout, QLabel, QLineEdit, QMessageBox, QPlainTextEdit, QProgressBar, QPushButton,
+                             QSpinBox, QVBoxLayout)
+startup.mark('import PyQt5.QtWidgets')
+from typing import TYPE_CHECKING, Dict, Optional
+
+if TYPE_CHECKING:
+    from session import OperationType
+
+TICK = 50   # 进度条刷新间隔, 毫秒
+
+
+def catch(function):
+    """与 logger.catch 相同: 记录异常并返回 None, 但直到第一次出错才导入 loguru"""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        try:
+            return function(*args, **kwargs)
+        except Exception:
+            from loguru import logger
+            logger.opt(depth=1).exception(f'An error has been caught in function {function.__qualname__!r}')
+    return wrapper
 
 
-class Setting:
-
-    @classmethod
-    def load_range(cls, username, key: str) -> List[int]:
-        result = [0, 0, 0, 0, 0, 0]
-        c: str = f'{username}/range'
-        try:
-            with shelve.open(DB) as db:
-                result = db[c][key]
-        except Exception as e:
-            logger.trace(e)
-        finally:
-            logger.debug(f'load_range: [{c}][{key}] = {result}')
-            return result
-
-    @classmethod
-    def save_range(cls, username, key: str, values: List[int]) -> None:
-        c: str = f'{username}/range'
-        with shelve.open(DB, writeback=True) as db:
-            if isinstance(db.get(c), dict):
-                db[c][key] = values
-            else:
-                db[c] = {}
-            logger.debug(f'save_range: [{c}][{key}] = {values}')
+def preload():
+    """登录窗口显示之后导入后面才用到的模块并读取设置"""
+    from session import DB
+    from settings import get_store
+    QApplication.instance().aboutToQuit.connect(get_store(legacy=DB).flush)
+    startup.mark('preload session')
 
 
 class Configurator(QDialog):
-    @logger.catch
+    @catch
     def __init__(self, parent=None, username=None):
+        from session import OperationType
         super().__init__(parent)
         self.setWindowFlags(self.windowFlags() & ~Qt.WindowContextHelpButtonHint)
         self.username: str = username
         self.setWindowTitle(f'{username}/{self.__class__.__name__}')
+        self.calculators: Dict[OperationType, Calculator] = {}
         self.buttons = [QPushButton(op.value[0]) for op in OperationType]
         for button in self.buttons:
             button.clicked.connect(self.on_clicked)
+        self.bank_btn = QPushButton('题库练习')
+        self.bank_btn.clicked.connect(self.on_bank)
         self.set_layout()
 
     def set_layout(self):
         layout = QVBoxLayout()
         for button in self.buttons:
             layout.addWidget(button)
+        layout.addWidget(self.bank_btn)
         layout.addStretch()
         # layout.setSizeConstraint(QLayout.SetFixedSize)
         self.setLayout(layout)
 
-    @logger.catch
+    @catch
     def on_clicked(self, *args):
+        from session import OperationType
         text = self.sender().text()
         for operation in OperationType:
             if operation.value[0] == text:
-                calculator = Calculator(parent=self, operation=operation)
+                calculator = self.calculators.get(operation)
+                if calculator is None:
+                    calculator = self.calculators[operation] = Calculator(parent=self, operation=operation)
                 calculator.exec()
                 break
 
+    @catch
+    def on_bank(self, *args):
+        """选择 test_generator.py --format bin 生成的题库, 多个操作数、带括号的题目"""
+        filename, _ = QFileDialog.getOpenFileName(self, self.bank_btn.text(), '', '题库 (*.qbank)')
+        if not filename:
+            return
+        from bank import open_bank
+        try:
+            empty = not len(open_bank(filename))
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, self.windowTitle(), f'无法打开题库: {e}')
+            return
+        if empty:
+            QMessageBox.warning(self, self.windowTitle(), '题库里没有题目')
+            return
+        playground = PlayGround(parent=self, seconds=60, bank=filename)
+        playground.exec()
+
 
 class RangeSetting(QDialog):
-    @logger.catch
+    @catch
     def __init__(self, parent=None):
+        from session import OperationType
         super().__init__(parent)
         self.setWindowFlags(self.windowFlags() & ~Qt.WindowContextHelpButtonHint)
         self.username: OperationType = self.parent().username
@@ -99,13 +121,20 @@ class RangeSetting(QDialog):
             self.x2_spb.setMinimum(max(self.x1_spb.value(), self.x2_spb.value()))
             self.y1_spb.setMinimum(max(2, self.y1_spb.value()))
             self.y2_spb.setMinimum(max(self.y1_spb.value(), self.y2_spb.value()))
-        values = Setting.load_range(self.username, self.operation.name)
-        for value, spb in zip(values, self.spbs):
-            spb.setValue(value)
+        self.load()
         for spb in self.spbs:
             spb.valueChanged.connect(self.save)
         self.set_layout()
 
+    def load(self):
+        """重新打开时读取已保存的范围, 不触发 save"""
+        from session import Setting
+        values = Setting.load_range(self.username, self.operation.name)
+        for value, spb in zip(values, self.spbs):
+            spb.blockSignals(True)
+            spb.setValue(value)
+            spb.blockSignals(False)
+
     def set_layout(self):
         grid = QGridLayout()
         grid.addWidget(QLabel('X:'), 0, 0, 1, 1)
@@ -127,32 +156,13 @@ class RangeSetting(QDialog):
         # layout.setSizeConstraint(QLayout.SetFixedSize)
         self.setLayout(layout)
 
-    @logger.catch
+    @catch
     def save(self, *args):
-        xs = x1, x2 = sorted([self.x1_spb.value(), self.x2_spb.value()])
-        ys = y1, y2 = sorted([self.y1_spb.value(), self.y2_spb.value()])
-        answers = sorted([self.answer1_spb.value(), self.answer2_spb.value()])
-        # 检查结果范围
-        if self.operation == OperationType.ADDITION:
-            a1 = x1 + y1
-            a2 = x2 + y2
-        elif self.operation == OperationType.SUBTRACTION:
-            a1 = x1 - y2
-            a2 = x2 - y1
-            assert a2 >= 0
-        elif self.operation == OperationType.MULTIPLICATION:
-            a1 = x1 * y1
-            a2 = x2 * y2
-        elif self.operation == OperationType.DIVISION:
-            a1 = x1 // y2
-            a2 = x2 // y1
-            assert a2 >= 0
-        else:
-            return
-        answers = [max(max(0, a1), answers[0]), min(max(0, a2), answers[1])]
-        self.answer1_spb.setValue(answers[0])
-        self.answer2_spb.setValue(answers[1])
-        Setting.save_range(username=self.username, key=self.operation.name, values=xs + ys + answers)
+        from session import Setting, clamp_range
+        values = clamp_range(self.operation, [spb.value() for spb in self.spbs])
+        self.answer1_spb.setValue(values[4])
+        self.answer2_spb.setValue(values[5])
+        Setting.save_range(username=self.username, key=self.operation.name, values=values)
 
 
 class ValueLineEdit(QLineEdit):
@@ -166,60 +176,81 @@ class ValueLineEdit(QLineEdit):
 
 
 class PlayGround(QDialog):
-    @logger.catch
-    def __init__(self, parent=None, seconds=60):
+    spoken = pyqtSignal(str, str)
+
+    @catch
+    def __init__(self, parent=None, seconds=60, speak=False, bank=None):
+        """bank 为二进制题库文件名时从题库出题, 题目是空格前后两段文字"""
+        from session import BankSession, Session, Setting
         super().__init__(parent)
         self.setWindowFlags(self.windowFlags() & ~Qt.WindowContextHelpButtonHint)
-        self.operation: OperationType = self.parent().operation
+        self.operation: Optional[OperationType] = getattr(self.parent(), 'operation', None)
         self.username: str = self.parent().username
-        values = Setting.load_range(self.username, self.operation.name)
-        self.x1, self.x2, self.y1, self.y2, self.a1, self.a2 = values
+        self.bank: Optional[str] = bank
+        if bank is None:
+            values = Setting.load_range(self.username, self.operation.name)
+            self.x1, self.x2, self.y1, self.y2, self.a1, self.a2 = values
+            self.session = Session(self.username, self.operation, seconds)
+        else:
+            self.session = BankSession(self.username, bank, seconds)
         self.seconds: int = seconds
         self.setWindowTitle(f'{self.seconds} Seconds Play')
+        self.speaker = self.sound = None
+        self.speaking: str = ''
+        if speak:
+            self.set_speaker()
 
-        self.start_at = time.time()
-        self.stop_at = self.start_at + self.seconds
         self.progress = QProgressBar()
         self.progress.setMaximum(10000)
         self.progress.setTextVisible(False)
         self.progress.setFixedHeight(1)
-        self.value1_spb = QSpinBox()
-        self.value1_spb.setLineEdit(ValueLineEdit())
-        self.value1_spb.setMaximum(max(self.x2, self.y2))
-        self.value1_spb.setButtonSymbols(QAbstractSpinBox.NoButtons)
-        self.operation_lbl = QLabel(self.operation.value[0])
-        self.value2_spb = QSpinBox()
-        self.value2_spb.setLineEdit(ValueLineEdit())
-        self.value2_spb.setMaximum(max(self.x2, self.y2))
-        self.value2_spb.setButtonSymbols(QAbstractSpinBox.NoButtons)
-        self.equal_lbl = QLabel('=')
         self.answer_spb = QSpinBox()
         self.answer_spb.setAlignment(Qt.AlignCenter)
         self.answer_spb.setRange(0, 2 ** 16)
         self.answer_spb.setButtonSymbols(QAbstractSpinBox.NoButtons)
         self.answer_spb.focusOutEvent = lambda x: self.answer_spb.setFocus()
         self.answer_spb.lineEdit().returnPressed.connect(self.check)
-        self.tests: List[List] = []
-        self.widgets = [self.value1_spb, self.operation_lbl, self.value2_spb, self.equal_lbl, self.answer_spb]
+        if bank is None:
+            self.value1_spb = QSpinBox()
+            self.value1_spb.setLineEdit(ValueLineEdit())
+            self.value1_spb.setMaximum(max(self.x2, self.y2))
+            self.value1_spb.setButtonSymbols(QAbstractSpinBox.NoButtons)
+            self.operation_lbl = QLabel(self.operation.value[0])
+            self.value2_spb = QSpinBox()
+            self.value2_spb.setLineEdit(ValueLineEdit())
+            self.value2_spb.setMaximum(max(self.x2, self.y2))
+            self.value2_spb.setButtonSymbols(QAbstractSpinBox.NoButtons)
+            self.equal_lbl = QLabel('=')
+            self.widgets = [self.value1_spb, self.operation_lbl, self.value2_spb, self.equal_lbl, self.answer_spb]
+            font_size = 256
+        else:
+            self.left_lbl = QLabel()
+            self.right_lbl = QLabel()
+            self.widgets = [self.left_lbl, self.answer_spb, self.right_lbl]
+            font_size = 96   # 多个操作数的等式比较长
+        self.key_ns: int = 0
+        self.tests = self.session.tests
         for w in self.widgets:
-            w.setStyleSheet('border: none; background: transparent; font-size: 256px;')
-        self.answer_spb.setStyleSheet('font-size: 256px;')
+            w.setStyleSheet(f'border: none; background: transparent; font-size: {font_size}px;')
+        self.answer_spb.setStyleSheet(f'font-size: {font_size}px;')
         self.result_edt = QPlainTextEdit()
         self.result_edt.setReadOnly(True)
         self.result_edt.setVisible(False)
+        if instrument.enabled:
+            self.answer_spb.lineEdit().installEventFilter(self)
+            for w in self.widgets + [self.progress]:
+                w.paintEvent = instrument.timed('paint')(w.paintEvent)
         self.set_layout()
         self.show()
         self.next()
-        self.timer = self.startTimer(50, Qt.PreciseTimer)
+        self.tick_ns = instrument.now()
+        self.timer = self.startTimer(TICK, Qt.PreciseTimer)
 
     def set_layout(self):
         body = QHBoxLayout()
         body.addStretch()
-        body.addWidget(self.value1_spb)
-        body.addWidget(self.operation_lbl)
-        body.addWidget(self.value2_spb)
-        body.addWidget(self.equal_lbl)
-        body.addWidget(self.answer_spb)
+        for widget in self.widgets:
+            body.addWidget(widget)
         body.addStretch()
         layout = QVBoxLayout()
         layout.addWidget(self.progress)
@@ -229,84 +260,94 @@ class PlayGround(QDialog):
         layout.addStretch()
         self.setLayout(layout)
 
+    def set_speaker(self):
+        """合成在后台线程, 播放用 QSoundEffect; 没有 QtMultimedia 时由后台线程直接朗读"""
+        from speech import get_speaker
+        try:
+            from PyQt5.QtMultimedia import QSoundEffect
+            self.sound = QSoundEffect(self)
+            self.spoken.connect(self.play)
+        except ImportError as e:
+            from loguru import logger
+            logger.debug(e)
+        self.speaker = get_speaker(on_ready=self.on_spoken if self.sound is not None else None)
+
+    def on_spoken(self, text: str, path: str):
+        """在后台线程里调用"""
+        try:
+            self.spoken.emit(text, path)
+        except RuntimeError:   # 对话框已经关闭
+            pass
+
+    def play(self, text: str, path: str):
+        if text == self.speaking and self.answer_spb.isVisible():
+            self.sound.setSource(QUrl.fromLocalFile(path))
+            self.sound.play()
+
+    def speak(self):
+        from speech import question_text
+        opc = self.operation.value[1]
+        self.speaking = question_text(self.session.question[0], opc, self.session.question[1])
+        path = self.speaker.speak(self.speaking)
+        if path is not None and self.sound is not None:
+            self.play(self.speaking, path)
+        self.speaker.prerender([question_text(x, opc, y) for x, y in self.session.upcoming(3)])
+
+    def eventFilter(self, source, event):
+        if event.type() == QEvent.KeyPress and event.key() in (Qt.Key_Return, Qt.Key_Enter):
+            self.key_ns = instrument.now()
+        return super().eventFilter(source, event)
+
     def timerEvent(self, *args, **kwargs):
-        progress = int((time.time() - self.start_at) / self.seconds * self.progress.maximum())
-        self.progress.setValue(progress)
-        if time.time() >= self.stop_at:
+        ns = instrument.now()
+        if instrument.enabled:
+            instrument.record('timer_jitter', abs(ns - self.tick_ns - TICK * 10 ** 6))
+            self.tick_ns = ns
+        self.progress.setValue(int(self.session.elapsed() * self.progress.maximum()))
+        if self.session.expired:
             self.killTimer(self.timer)
             self.score()
 
-    @logger.catch
+    @catch
+    @instrument.timed('next')
     def next(self):
-        while True:
-            x = random.randint(self.x1, self.x2)
-            y = random.randint(self.y1, self.y2)
-            opc = self.operation.value[1]
-            ref = int(eval(f'{x}{opc}{y}'))
-            if self.a1 <= ref <= self.a2:
-                self.value1_spb.setValue(x)
-                self.value2_spb.setValue(y)
-                self.answer_spb.clear()
-                self.answer_spb.start_at = time.time()
-                self.answer_spb.setFocus()
-                break
-
-    @logger.catch
+        question = self.session.next()
+        if self.bank is None:
+            x, y = question
+            self.value1_spb.setValue(x)
+            self.value2_spb.setValue(y)
+        else:
+            left, right = self.session.parts()   # 只渲染当前这一道题目
+            self.left_lbl.setText(left)
+            self.right_lbl.setText(right)
+        self.answer_spb.clear()
+        self.answer_spb.setFocus()
+        if self.speaker is not None:
+            self.speak()
+
+    @catch
     def check(self, *args):
         if not self.answer_spb.lineEdit().text():
             return
-        value1 = self.value1_spb.value()
-        value2 = self.value2_spb.value()
-        opc = self.operation.value[1]
-        oph = self.operation.value[0]
-        answer = self.answer_spb.value()
-        ref = int(eval(f'{value1}{opc}{value2}'))
-        correct = answer == ref
-        start_at = self.answer_spb.start_at
-        finish_at = time.time()
-        self.tests.append([
-            value1,
-            opc,
-            oph,
-            value2,
-            answer,
-            ref,
-            correct,
-            [finish_at - start_at, start_at, finish_at]
-        ])
+        self.session.check(self.answer_spb.value())
+        if self.key_ns:   # 出下一题的耗时另有 next 统计
+            instrument.record('keystroke_to_check', instrument.now() - self.key_ns)
+            self.key_ns = 0
         self.next()
 
-    @logger.catch
+    @catch
     def score(self):
         for widget in self.widgets:
             widget.setVisible(False)
         self.progress.setVisible(False)
         self.result_edt.setVisible(True)
 
-        with shelve.open(DB, writeback=True) as db:
-            c: str = f'{self.username}/tests'
-            if c not in db:
-                db[c] = []
-            for test in self.tests:
-                db[c].append(test)
-            logger.debug(f'save_score: [{c}] {test}')
-            logger.debug(f'score_length: [{c}] {len(db[c])}')
-
-        incorrect = [test for test in self.tests if test[6] is False]
-        correct = [test for test in self.tests if test[6] is True]
-        total = len(self.tests)
-        rate_incorrect = len(incorrect) / max(1, total)
-        speed_correct = [test[7][0] for test in correct]
-        speed_correct = statistics.mean(speed_correct) if speed_correct else 0
-
-        text = f'错误: {len(incorrect)} / {total} [{rate_incorrect:0.1%}]\n速度: {speed_correct:0.1f}秒\n'
-        for value1, opc, oph, value2, answer, ref, correct, (t, t1, t2) in incorrect:
-            text += f'{value1} {oph} {value2} = {answer} [{ref}]\n'
-        self.result_edt.setPlainText(text)
+        self.session.finish()
+        self.result_edt.setPlainText(self.session.report())
 
 
 class Calculator(QDialog):
-    @logger.catch
+    @catch
     def __init__(self, parent=None, operation=None):
         super().__init__(parent)
         self.setWindowFlags(self.windowFlags() & ~Qt.WindowContextHelpButtonHint)
@@ -320,7 +361,10 @@ class Calculator(QDialog):
         for i, seconds in enumerate([] + list(range(60, 660, 60))):
             self.seconds_cmb.addItem(f'{seconds}')
             self.seconds_cmb.setItemData(i, Qt.AlignRight, Qt.TextAlignmentRole)
+        self.speak_chk = QCheckBox('朗读题目')
+        self.speak_chk.setEnabled(importlib.util.find_spec('pyttsx3') is not None)
         self.start_btn = QPushButton(f'Start {self.operation.value[0]} Test')
+        self.range_setting: Optional[RangeSetting] = None
         self.config_btn.clicked.connect(self.on_config)
         self.update_range()
         self.start_btn.clicked.connect(self.on_started)
@@ -332,13 +376,15 @@ class Calculator(QDialog):
         header.addWidget(self.config_btn, 0, 0, 1, 2)
         header.addWidget(QLabel('测试时间(秒):'), 1, 0, 1, 1)
         header.addWidget(self.seconds_cmb, 1, 1, 1, 1)
-        header.addWidget(self.start_btn, 2, 0, 1, 2)
+        header.addWidget(self.speak_chk, 2, 0, 1, 2)
+        header.addWidget(self.start_btn, 3, 0, 1, 2)
         layout = QVBoxLayout()
         layout.addLayout(header)
         layout.addStretch()
         self.setLayout(layout)
 
     def update_range(self, *args):
+        from session import Setting
         values = Setting.load_range(self.username, self.operation.name)
         x1, x2, y1, y2, a1, a2 = values
         self.config_btn.setText(f'[{x1},{x2}] {self.operation.value[0]} [{y1},{y2}] = [{a1},{a2}]')
@@ -346,17 +392,27 @@ class Calculator(QDialog):
             self.on_config()
 
     def on_config(self, *args):
-        RangeSetting(parent=self).exec()
+        if self.range_setting is None:
+            self.range_setting = RangeSetting(parent=self)
+        else:
+            self.range_setting.load()
+        self.range_setting.exec()
         self.update_range()
 
     def on_started(self, *args):
+        from sampler import PairSampler
+        from session import Setting
+        values = Setting.load_range(self.username, self.operation.name)
+        if not PairSampler.get(self.operation.value[1], values):
+            QMessageBox.warning(self, self.windowTitle(), '当前范围内没有符合条件的题目, 请修改范围')
+            return
         seconds = int(self.seconds_cmb.currentText())
-        playground = PlayGround(parent=self, seconds=seconds)
+        playground = PlayGround(parent=self, seconds=seconds, speak=self.speak_chk.isChecked())
         playground.exec()
 
 
 class LoginPage(QDialog):
-    @logger.catch
+    @catch
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowFlags(self.windowFlags() & ~Qt.WindowContextHelpButtonHint)
@@ -365,6 +421,7 @@ class LoginPage(QDialog):
         self.buttons = [QPushButton(n) for n in self.names]
         for button in self.buttons:
             button.clicked.connect(self.on_login)
+        self.configurators: Dict[str, Configurator] = {}
         self.set_layout()
 
     def set_layout(self):
@@ -374,14 +431,32 @@ class LoginPage(QDialog):
         self.setLayout(layout)
 
     def on_login(self, *args):
-        configurator = Configurator(parent=self, username=self.sender().text())
+        username = self.sender().text()
+        configurator = self.configurators.get(username)
+        if configurator is None:
+            configurator = self.configurators[username] = Configurator(parent=self, username=username)
         configurator.exec()
 
 
 if __name__ == '__main__':
+    import argparse
     import sys
-    app = QApplication(sys.argv)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--startup-report', nargs='?', const='-', default=None, metavar='FILE',
+                        help='显示登录窗口后输出启动耗时, 指定文件名时写成 JSON')
+    args, qt_args = parser.parse_known_args()
+    app = QApplication(sys.argv[:1] + qt_args)
     # app.setAttribute(Qt.AA_EnableHighDpiScaling)
+    startup.mark('QApplication')
     window = LoginPage()
+    startup.mark('LoginPage')
     window.show()
+    startup.mark('show')
+
+    def on_shown():
+        startup.mark('first event loop')
+        preload()
+        if args.startup_report:
+            startup.report(None if args.startup_report == '-' else args.startup_report)
+    QTimer.singleShot(0, on_shown)
     app.exec()
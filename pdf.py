@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+纯 Python 的 PDF 输出, 不依赖 wkhtmltopdf: 每页的内容流在进程池里并行生成并压缩,
+主进程按页序依次写入文件, 最后写页面树和交叉引用表.
+"""
+import collections
+import itertools
+import math
+import multiprocessing
+import zlib
+from typing import BinaryIO, Deque, Dict, Iterable, List, NamedTuple
+
+PAGE_WIDTH: int = 595   # A4, 单位为点
+PAGE_HEIGHT: int = 842
+MARGIN: int = 36
+COLUMNS: int = 4
+CHAR_WIDTH: float = 0.6   # Courier 每个字符宽 0.6 倍字号
+
+
+class Layout(NamedTuple):
+    per_page: int
+    font_size: float
+    column_width: float
+    row_height: float
+
+    @classmethod
+    def create(cls, per_page: int, width: int) -> 'Layout':
+        """width 为最长题目的字符数, 字号取能放下整列且不超过 16 的最大值"""
+        rows = math.ceil(per_page / COLUMNS)
+        column_width = (PAGE_WIDTH - 2 * MARGIN) / COLUMNS
+        row_height = (PAGE_HEIGHT - 2 * MARGIN) / rows
+        font_size = min(16.0, column_width * 0.9 / (CHAR_WIDTH * max(1, width)), row_height * 0.7)
+        return cls(per_page, round(font_size, 2), column_width, row_height)
+
+
+def escape(text: str) -> bytes:
+    data = text.encode('latin-1', errors='replace')
+    return data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+def render_page(questions: List[str], layout: Layout) -> bytes:
+    """一页的压缩内容流: 题目按行从左到右排列"""
+    lines: List[bytes] = [b'BT', b'/F1 %.2f Tf' % layout.font_size]
+    for i, question in enumerate(questions):
+        row, column = divmod(i, COLUMNS)
+        x = MARGIN + column * layout.column_width
+        y = PAGE_HEIGHT - MARGIN - (row + 1) * layout.row_height + (layout.row_height - layout.font_size) / 2
+        lines.append(b'1 0 0 1 %.2f %.2f Tm (%s) Tj' % (x, y, escape(question)))
+    lines.append(b'ET')
+    return zlib.compress(b'\n'.join(lines))
+
+
+class PdfWriter:
+    """按页流式写 PDF; 对象 1 为目录, 2 为页面树(最后写), 3 为字体"""
+
+    def __init__(self, filename: str, title: str):
+        self.f: BinaryIO = open(filename, 'wb', buffering=1 << 20)
+        self.title: str = title
+        self.offsets: Dict[int, int] = {}
+        self.pages: List[int] = []
+        self.next_id: int = 4
+        self.f.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        self.write_object(3, b'<< /Type /Font /Subtype /Type1 /BaseFont /Courier /Encoding /WinAnsiEncoding >>')
+
+    def write_object(self, object_id: int, body: bytes):
+        self.offsets[object_id] = self.f.tell()
+        self.f.write(b'%d 0 obj\n' % object_id)
+        self.f.write(body)
+        self.f.write(b'\nendobj\n')
+
+    def allocate(self) -> int:
+        self.next_id += 1
+        return self.next_id - 1
+
+    def add_page(self, content: bytes):
+        content_id, page_id = self.allocate(), self.allocate()
+        self.write_object(content_id, b'<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream' % (len(content), content))
+        self.write_object(page_id, b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] '
+                                   b'/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>'
+                          % (PAGE_WIDTH, PAGE_HEIGHT, content_id))
+        self.pages.append(page_id)
+
+    def close(self):
+        if not self.pages:
+            self.add_page(zlib.compress(b''))
+        kids = b' '.join(b'%d 0 R' % page_id for page_id in self.pages)
+        self.write_object(2, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(self.pages)))
+        self.write_object(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+        info_id = self.allocate()
+        self.write_object(info_id, b'<< /Title (%s) /Producer (calculator) >>' % escape(self.title))
+        xref = self.f.tell()
+        self.f.write(b'xref\n0 %d\n0000000000 65535 f \n' % self.next_id)
+        for object_id in range(1, self.next_id):
+            self.f.write(b'%010d 00000 n \n' % self.offsets[object_id])
+        self.f.write(b'trailer\n<< /Size %d /Root 1 0 R /Info %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (self.next_id, info_id, xref))
+        self.f.close()
+
+
+def render_pdf(questions: Iterable[str], filename: str, title: str, width: int, per_page: int = 80, workers: int = 1):
+    """
+    每 per_page 道题目一页, workers 大于 1 时在进程池里并行生成各页,
+    同时在途的页数有上限, 内存占用与题库大小无关.
+    """
+    layout = Layout.create(per_page, width)
+    iterator = iter(questions)
+    pages: Iterable[List[str]] = iter(lambda: list(itertools.islice(iterator, per_page)), [])
+    writer = PdfWriter(filename, title)
+    if workers <= 1:
+        for page in pages:
+            writer.add_page(render_page(page, layout))
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            pending: Deque = collections.deque()
+            for page in pages:
+                pending.append(pool.apply_async(render_page, (page, layout)))
+                if len(pending) >= workers * 4:
+                    writer.add_page(pending.popleft().get())
+            while pending:
+                writer.add_page(pending.popleft().get())
+    writer.close()
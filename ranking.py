@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+题库的随机访问: 按 generate_one 的输出顺序直接取第 k 道题目, 或均匀抽取 M 道不重复的题目, 不需要枚举题库.
+
+操作数组合按字典序排列, 前缀 p 之后所有组合的题目数可以由片段计数算出:
+    G(p) = Σ_{k<|p|} C(p[:k]) · S(p[k:], n-|p|) + Σ_{k>=|p|} S(p, k-|p|) · S((), n-k)
+其中 C(q) 是片段 q 按结果分组的表达式个数, S(q, j) = Σ_{c ∈ values^j} C(q + c), · 为按结果的内积.
+逐位确定操作数时只需要比较这些计数.
+"""
+import random
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from expression import SliceTable, Template, Value
+from test_generator import Config, get_question_list
+
+Counts = Dict[Value, int]
+
+
+def dot(a: Counts, b: Counts) -> int:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(c * b.get(v, 0) for v, c in a.items())
+
+
+class QuestionIndex:
+    """当前 Config 下题库的排名/反排名, 创建之后不要再修改 Config"""
+
+    def __init__(self):
+        Config.validate()
+        self.values: List[int] = [v for v in range(Config.value_min, Config.value_max + 1)]
+        self.numbers: int = Config.numbers
+        self.table = SliceTable(tuple(Config.operates), Config.bracket)
+        self.sums: Dict[Tuple[Tuple[int, ...], int], Counts] = {}
+        self.totals: Dict[Tuple[int, ...], int] = {}
+        self.total: int = self.numbers * self.get_total(())
+
+    def __len__(self) -> int:
+        return self.total
+
+    def get_counts(self, part: Tuple[int, ...]) -> Counts:
+        return {v: len(ts) for v, ts in self.table.get(part).index.items()}
+
+    def get_sum(self, part: Tuple[int, ...], j: int) -> Counts:
+        """S(part, j): part 后面再接 j 个任意操作数时, 各个结果的表达式个数之和"""
+        if j == 0:
+            return self.get_counts(part)
+        key = (part, j)
+        result = self.sums.get(key)
+        if result is None:
+            result = {}
+            for x in self.values:
+                for v, c in self.get_sum(part + (x,), j - 1).items():
+                    result[v] = result.get(v, 0) + c
+            self.sums[key] = result
+        return result
+
+    def get_total(self, prefix: Tuple[int, ...]) -> int:
+        """G(prefix): 以 prefix 开头的所有操作数组合能组成的等式个数"""
+        result = self.totals.get(prefix)
+        if result is None:
+            m, n = len(prefix), self.numbers
+            result = sum(dot(self.get_counts(prefix[:k]), self.get_sum(prefix[k:], n - m)) for k in range(1, m))
+            result += sum(dot(self.get_sum(prefix, k - m), self.get_sum((), n - k)) for k in range(max(1, m), n))
+            self.totals[prefix] = result
+        return result
+
+    def get_equations(self, vs: Tuple[int, ...]) -> Iterator[Tuple[int, Template, Template, int]]:
+        """组合 vs 的每个等号位置上的左侧模板, 以及与之相等的右侧模板个数"""
+        for k in range(1, self.numbers):
+            right = self.table.get(vs[k:]).index
+            for a, value in self.table.get(vs[:k]).forms:
+                yield k, a, right.get(value, []), value
+
+    def unrank(self, rank: int) -> str:
+        """第 rank 道题目(从 0 开始), 与 list(generate_one())[rank] 相同"""
+        if not 0 <= rank < self.total:
+            raise IndexError(rank)
+        rank, blank = divmod(rank, self.numbers)
+        vs: Tuple[int, ...] = ()
+        while len(vs) < self.numbers:
+            for x in self.values:
+                total = self.get_total(vs + (x,))
+                if rank < total:
+                    vs += (x,)
+                    break
+                rank -= total
+        for k, a, bs, value in self.get_equations(vs):
+            if rank < len(bs):
+                return self.format(vs, k, a, bs[rank], blank)
+            rank -= len(bs)
+        raise AssertionError('inconsistent counts')
+
+    def rank(self, es: List[Union[int, str]], blank: int) -> int:
+        """unrank 的逆运算: 等式 es 挖去第 blank 个操作数得到的题目序号"""
+        vs: Tuple[int, ...] = tuple(e for e in es if isinstance(e, int))
+        position = es.index('=')
+        k = len([e for e in es[:position] if isinstance(e, int)])
+        result = 0
+        for m in range(self.numbers):
+            for x in self.values:
+                if x == vs[m]:
+                    break
+                result += self.get_total(vs[:m] + (x,))
+        for split, a, bs, value in self.get_equations(vs):
+            if split == k and a.tokens(vs[:k]) == es[:position]:
+                for b in bs:
+                    if b.tokens(vs[k:]) == es[position + 1:]:
+                        return result * self.numbers + blank
+                    result += 1
+                raise ValueError(es)
+            result += len(bs)
+        raise ValueError(es)
+
+    def format(self, vs: Tuple[int, ...], k: int, a: Template, b: Template, blank: int) -> str:
+        es: List[Union[int, str]] = [*a.tokens(vs[:k]), '=', *b.tokens(vs[k:])]
+        return list(get_question_list(es))[blank]
+
+    def sample(self, m: int, seed: Optional[int] = None) -> List[str]:
+        """均匀抽取 m 道不重复的题目, 耗时与 m 成正比, 与题库大小无关"""
+        r = random.Random(seed)
+        return [self.unrank(k) for k in r.sample(range(self.total), m)]
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+import bisect
+import random
+import threading
+from analytics import Aggregate
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+def calculate(opc: str, x: int, y: int) -> int:
+    """与 int(eval(f'{x}{opc}{y}')) 相同(操作数不小于 0)"""
+    if opc == '+':
+        return x + y
+    if opc == '-':
+        return x - y
+    if opc == '*':
+        return x * y
+    if opc == '/':
+        return x // y
+    raise ValueError(opc)
+
+
+def _search(f: Callable[[int], int], lo: int, hi: int, a1: int, a2: int) -> Tuple[int, int]:
+    """f 在 [lo, hi] 上单调不减, 返回满足 a1 <= f(y) <= a2 的 y 的区间, 为空时 first > last"""
+    left, right = lo, hi + 1
+    while left < right:   # 第一个 f(y) >= a1 的 y
+        middle = (left + right) // 2
+        if f(middle) >= a1:
+            right = middle
+        else:
+            left = middle + 1
+    first = left
+    left, right = lo, hi + 1
+    while left < right:   # 第一个 f(y) > a2 的 y
+        middle = (left + right) // 2
+        if f(middle) > a2:
+            right = middle
+        else:
+            left = middle + 1
+    return first, left - 1
+
+
+class AliasTable:
+    """Vose 别名表: 按权重 O(1) 抽样"""
+
+    def __init__(self, weights: List[float]):
+        n = len(weights)
+        total = sum(weights)
+        self.probability: List[float] = [1.0] * n
+        self.alias: List[int] = list(range(n))
+        scaled = [w * n / total for w in weights]
+        small = [i for i, w in enumerate(scaled) if w < 1]
+        large = [i for i, w in enumerate(scaled) if w >= 1]
+        while small and large:
+            s, g = small.pop(), large.pop()
+            self.probability[s] = scaled[s]
+            self.alias[s] = g
+            scaled[g] -= 1 - scaled[s]
+            (small if scaled[g] < 1 else large).append(g)
+
+    def sample(self, r: random.Random) -> int:
+        i = r.randrange(len(self.alias))
+        return i if r.random() < self.probability[i] else self.alias[i]
+
+
+class PairSampler:
+    """
+    一种运算在一组范围 (x1, x2, y1, y2, a1, a2) 内的全部有效题目 (x, y).
+    对每个 x, 有效的 y 是一个连续区间(运算结果随 y 单调), 按区间长度建别名表后 O(1) 均匀抽取.
+    """
+    _cache: Dict[Tuple[str, Tuple[int, ...]], 'PairSampler'] = {}
+    _cache_size: int = 64
+    _lock = threading.Lock()
+
+    def __init__(self, opc: str, ranges: Tuple[int, int, int, int, int, int], r: Optional[random.Random] = None):
+        self.opc: str = opc
+        self.ranges: Tuple[int, int, int, int, int, int] = tuple(ranges)
+        self.random: random.Random = r or random.Random()
+        x1, x2, y1, y2, a1, a2 = self.ranges
+        if opc == '/':
+            y1 = max(1, y1)   # 除数不能为 0
+        self.xs: List[int] = []
+        self.intervals: List[Tuple[int, int]] = []
+        for x in range(x1, x2 + 1):
+            if y1 > y2:
+                break
+            if opc in ('+', '*'):
+                first, last = _search(lambda y: calculate(opc, x, y), y1, y2, a1, a2)
+            else:   # 减法和除法的结果随 y 单调不增
+                first, last = _search(lambda y: -calculate(opc, x, y), y1, y2, -a2, -a1)
+            if first <= last:
+                self.xs.append(x)
+                self.intervals.append((first, last))
+        self.size: int = sum(last - first + 1 for first, last in self.intervals)
+        self.table: Optional[AliasTable] = AliasTable([last - first + 1 for first, last in self.intervals]) if self.size else None
+
+    def __len__(self) -> int:
+        return self.size
+
+    def pairs(self):
+        for x, (first, last) in zip(self.xs, self.intervals):
+            for y in range(first, last + 1):
+                yield x, y
+
+    def sample(self) -> Tuple[int, int]:
+        if self.table is None:
+            raise ValueError(f'no valid question for {self.opc} in {self.ranges}')
+        i = self.table.sample(self.random)
+        first, last = self.intervals[i]
+        return self.xs[i], self.random.randint(first, last)
+
+    @classmethod
+    def get(cls, opc: str, ranges: List[int]) -> 'PairSampler':
+        """按 (运算, 范围) 缓存, 多个用户同时使用不同范围时也不会反复重建"""
+        key = (opc, tuple(ranges))
+        with cls._lock:
+            sampler = cls._cache.pop(key, None)
+            if sampler is None:
+                sampler = cls(opc, key[1])
+            cls._cache[key] = sampler   # 最近使用的放在最后
+            while len(cls._cache) > cls._cache_size:
+                del cls._cache[next(iter(cls._cache))]
+        return sampler
+
+
+class FenwickTree:
+    """树状数组: O(log n) 修改单个权重, O(log n) 按前缀和定位"""
+
+    def __init__(self, weights: List[float]):
+        self.size: int = len(weights)
+        self.weights: List[float] = list(weights)
+        self.tree: List[float] = [0.0] + list(weights)
+        for i in range(1, self.size + 1):   # O(n) 建树
+            j = i + (i & -i)
+            if j <= self.size:
+                self.tree[j] += self.tree[i]
+        self.mask: int = 1 << self.size.bit_length() if self.size else 0
+
+    def set(self, i: int, weight: float):
+        delta = weight - self.weights[i]
+        self.weights[i] = weight
+        i += 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def total(self) -> float:
+        result, i = 0.0, self.size
+        while i > 0:
+            result += self.tree[i]
+            i -= i & -i
+        return result
+
+    def find(self, value: float) -> int:
+        """前缀和超过 value 的第一个下标"""
+        i, step = 0, self.mask
+        while step:
+            j = i + step
+            if j <= self.size and self.tree[j] <= value:
+                i = j
+                value -= self.tree[j]
+            step >>= 1
+        return min(i, self.size - 1)
+
+
+def get_weight(aggregate: Optional[Aggregate], latency: float) -> float:
+    """
+    题目的抽取权重: 错误率(加一平滑, 没做过的题目按 50% 计)越高、比平均用时越慢, 权重越大.
+    latency 是该运算答对题目的平均用时.
+    """
+    if aggregate is None or not aggregate.total:
+        return 1.0
+    error = (aggregate.total - aggregate.correct + 1) / (aggregate.total + 2)
+    slow = min(aggregate.trend_latency / latency, 4.0) if aggregate.correct and latency > 0 else 1.0
+    return (error + 0.1) * (1 + slow) / 1.2
+
+
+class AdaptiveSampler:
+    """
+    在 PairSampler 的全部有效题目上按 get_weight 抽取, 常错和慢的题目出现得更多.
+    每次作答后只修改这道题目的权重, 抽取和修改都是 O(log n).
+    """
+
+    def __init__(self, sampler: PairSampler, facts: Dict[str, Aggregate], latency: float = 0.0,
+                 r: Optional[random.Random] = None):
+        self.sampler: PairSampler = sampler
+        self.opc: str = sampler.opc
+        self.latency: float = latency
+        self.random: random.Random = r or random.Random()
+        self.offsets: List[int] = []   # 每个 x 的第一道题目的下标
+        self.rows: Dict[int, int] = {x: i for i, x in enumerate(sampler.xs)}
+        offset = 0
+        for first, last in sampler.intervals:
+            self.offsets.append(offset)
+            offset += last - first + 1
+        self.facts: Dict[Tuple[int, int], Aggregate] = {}
+        weights = [1.0] * sampler.size
+        for fact, aggregate in facts.items():
+            x, y = (int(v) for v in fact.split(self.opc))
+            i = self.index(x, y)
+            if i is not None:
+                self.facts[x, y] = Aggregate(aggregate.to_json())   # 复制, 不修改 Analytics 的缓存
+                weights[i] = get_weight(aggregate, latency)
+        self.tree = FenwickTree(weights)
+        self.last: Optional[Tuple[int, int]] = None
+
+    def __len__(self) -> int:
+        return self.sampler.size
+
+    def index(self, x: int, y: int) -> Optional[int]:
+        row = self.rows.get(x)
+        if row is None:
+            return None
+        first, last = self.sampler.intervals[row]
+        return self.offsets[row] + y - first if first <= y <= last else None
+
+    def pair(self, i: int) -> Tuple[int, int]:
+        row = bisect.bisect_right(self.offsets, i) - 1
+        return self.sampler.xs[row], self.sampler.intervals[row][0] + i - self.offsets[row]
+
+    def sample(self) -> Tuple[int, int]:
+        """按权重抽取, 尽量不连续出同一道题目"""
+        if not self.sampler.size:
+            raise ValueError(f'no valid question for {self.opc} in {self.sampler.ranges}')
+        for _ in range(3):
+            pair = self.pair(self.tree.find(self.random.random() * self.tree.total()))
+            if pair != self.last:
+                break
+        self.last = pair
+        return pair
+
+    def update(self, x: int, y: int, correct: bool, latency: float, finish_at: float):
+        """作答后更新这道题目的权重"""
+        i = self.index(x, y)
+        if i is None:
+            return
+        aggregate = self.facts.setdefault((x, y), Aggregate())
+        aggregate.add(correct, latency, finish_at)
+        self.tree.set(i, get_weight(aggregate, self.latency))
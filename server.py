@@ -0,0 +1,378 @@
+# -*- coding: utf-8 -*-
+"""
+教室用的测试服务器: 一个进程同时为几十个学生提供限时测试, 只依赖标准库 asyncio.
+
+HTTP:
+    GET  /                  浏览器页面
+    GET  /api/range         ?username=..&operation=ADDITION, 返回 {"values": [x1, x2, y1, y2, a1, a2]}
+    POST /api/range         {"username": .., "operation": .., "values": [...]}, 返回整理后的范围
+    GET  /ws                WebSocket, 一个连接进行一次测试
+
+WebSocket 消息都是 JSON:
+    -> {"type": "start", "username": .., "operation": "ADDITION", "seconds": 60}
+    <- {"type": "question", "value1": .., "operation": "+", "value2": .., "remaining": 秒}
+    -> {"type": "answer", "answer": 12}
+    <- {"type": "result", "correct": true, "ref": 12}, 接着是下一道题目
+    <- {"type": "score", "text": ..}, 时间到或连接断开时保存记录
+    <- {"type": "error", "message": ..}, 测试中收到格式不对的消息时带 "fatal": false, 测试继续
+
+判题和计时都在服务器上, 读写数据库放到线程池里, 不阻塞事件循环.
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import html
+import json
+import sqlite3
+import struct
+from loguru import logger
+from typing import Dict, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+from history import get_history
+from session import DB, OperationType, Session, Setting, clamp_range
+from settings import get_store
+
+WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+MAX_BODY = 1 << 16
+MAX_HEADERS = 100
+MAX_SECONDS = 3600
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large'}
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str = ''):
+        super().__init__(message or REASONS.get(status, ''))
+        self.status: int = status
+
+
+class Request(NamedTuple):
+    method: str
+    path: str
+    query: Dict[str, str]
+    headers: Dict[str, str]
+    body: bytes
+
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[Request]:
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, target, _ = line.decode('latin-1').split(' ', 2)
+    except ValueError:
+        raise HttpError(400)
+    headers: Dict[str, str] = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        if len(headers) >= MAX_HEADERS:
+            raise HttpError(400, 'too many headers')
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    if length > MAX_BODY:
+        raise HttpError(413)
+    body = await reader.readexactly(length) if length else b''
+    url = urlsplit(target)
+    return Request(method.upper(), url.path, dict(parse_qsl(url.query)), headers, body)
+
+
+def write_response(writer: asyncio.StreamWriter, status: int, body: bytes,
+                   content_type: str = 'application/json; charset=utf-8'):
+    writer.write(f'HTTP/1.1 {status} {REASONS.get(status, "")}\r\n'
+                 f'Content-Type: {content_type}\r\n'
+                 f'Content-Length: {len(body)}\r\n'
+                 f'Cache-Control: no-store\r\n\r\n'.encode('latin-1') + body)
+
+
+def write_json(writer: asyncio.StreamWriter, data, status: int = 200):
+    write_response(writer, status, json.dumps(data, ensure_ascii=False).encode('utf-8'))
+
+
+class WebSocket:
+    """RFC 6455 服务器端, 只支持文本消息"""
+    MAX_MESSAGE = 1 << 16
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.closed: bool = False
+
+    @staticmethod
+    def accept(request: Request, writer: asyncio.StreamWriter):
+        key = request.headers.get('sec-websocket-key')
+        if request.headers.get('upgrade', '').lower() != 'websocket' or not key:
+            raise HttpError(400, 'websocket upgrade required')
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode('latin-1')).digest()).decode('latin-1')
+        writer.write(f'HTTP/1.1 101 Switching Protocols\r\n'
+                     f'Upgrade: websocket\r\nConnection: Upgrade\r\n'
+                     f'Sec-WebSocket-Accept: {accept}\r\n\r\n'.encode('latin-1'))
+
+    async def read_frame(self) -> Tuple[bool, int, bytes]:
+        head = await self.reader.readexactly(2)
+        fin, opcode = bool(head[0] & 0x80), head[0] & 0x0f
+        masked, length = bool(head[1] & 0x80), head[1] & 0x7f
+        if length == 126:
+            length, = struct.unpack('!H', await self.reader.readexactly(2))
+        elif length == 127:
+            length, = struct.unpack('!Q', await self.reader.readexactly(8))
+        if length > self.MAX_MESSAGE:
+            raise HttpError(413)
+        mask = await self.reader.readexactly(4) if masked else b''
+        payload = await self.reader.readexactly(length)
+        if mask and length:
+            mask = (mask * (length // 4 + 1))[:length]
+            payload = (int.from_bytes(payload, 'big') ^ int.from_bytes(mask, 'big')).to_bytes(length, 'big')
+        return fin, opcode, payload
+
+    def write_frame(self, opcode: int, payload: bytes):
+        length = len(payload)
+        if length < 126:
+            head = struct.pack('!BB', 0x80 | opcode, length)
+        elif length < 1 << 16:
+            head = struct.pack('!BBH', 0x80 | opcode, 126, length)
+        else:
+            head = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+        self.writer.write(head + payload)
+
+    async def receive(self) -> Optional[str]:
+        """下一条文本消息, 连接关闭时返回 None"""
+        fragments = []
+        while not self.closed:
+            try:
+                fin, opcode, payload = await self.read_frame()
+            except (asyncio.IncompleteReadError, ConnectionError):
+                self.closed = True
+                return None
+            if opcode == 0x8:   # close
+                await self.close()
+                return None
+            if opcode == 0x9:   # ping
+                self.write_frame(0xA, payload)
+                continue
+            if opcode in (0x0, 0x1):
+                fragments.append(payload)
+                if sum(map(len, fragments)) > self.MAX_MESSAGE:
+                    raise HttpError(413)
+                if fin:
+                    return b''.join(fragments).decode('utf-8')
+        return None
+
+    async def send(self, data: Dict):
+        if self.closed:
+            return
+        self.write_frame(0x1, json.dumps(data, ensure_ascii=False).encode('utf-8'))
+        await self.writer.drain()
+
+    async def close(self):
+        if not self.closed:
+            self.closed = True
+            try:
+                self.write_frame(0x8, b'')
+                await self.writer.drain()
+            except ConnectionError:
+                pass
+
+
+def get_operation(name: Optional[str]) -> OperationType:
+    try:
+        return OperationType[name]
+    except KeyError:
+        raise HttpError(400, f'unknown operation: {name}')
+
+
+class Classroom:
+    """当前进行中的全部测试"""
+
+    def __init__(self):
+        self.sessions: Dict[int, Session] = {}
+
+    async def run_session(self, ws: WebSocket, message: Dict):
+        loop = asyncio.get_running_loop()
+        username = str(message.get('username') or '')
+        if not username:
+            raise HttpError(400, 'username required')
+        operation = get_operation(message.get('operation'))
+        seconds = min(max(int(message.get('seconds', 60)), 1), MAX_SECONDS)
+        session = await loop.run_in_executor(None, Session, username, operation, seconds)
+        if not len(session.sampler):
+            await ws.send({'type': 'error', 'message': '当前范围内没有符合条件的题目, 请修改范围'})
+            return
+        self.sessions[id(session)] = session
+        logger.info(f'start: [{username}] {operation.name} {seconds}s, {len(self.sessions)} sessions')
+        try:
+            await self.send_question(ws, session)
+            while not session.expired:
+                try:
+                    text = await asyncio.wait_for(ws.receive(), session.remaining())
+                except asyncio.TimeoutError:
+                    break
+                if text is None:
+                    break
+                try:
+                    message = json.loads(text)
+                    if not isinstance(message, dict):
+                        raise TypeError(f'expected an object, got {text!r}')
+                    if message.get('type') != 'answer' or session.expired:
+                        continue
+                    answer = int(message['answer'])
+                except (ValueError, KeyError, TypeError) as e:   # 一条消息不对不影响测试, 当前题目不变
+                    await ws.send({'type': 'error', 'message': f'bad message: {e!r}', 'fatal': False})
+                    continue
+                record = session.check(answer)
+                await ws.send({'type': 'result', 'correct': record.correct, 'ref': record.ref})
+                await self.send_question(ws, session)
+        finally:
+            del self.sessions[id(session)]
+            text = await loop.run_in_executor(None, self.finish, session)
+        await ws.send({'type': 'score', 'text': text})
+
+    @staticmethod
+    def finish(session: Session) -> str:
+        session.finish()
+        return session.report()
+
+    @staticmethod
+    async def send_question(ws: WebSocket, session: Session):
+        value1, value2 = session.next()
+        await ws.send({'type': 'question', 'value1': value1, 'operation': session.operation.value[0],
+                       'value2': value2, 'remaining': session.remaining()})
+
+    async def websocket(self, ws: WebSocket):
+        while True:
+            text = await ws.receive()
+            if text is None:
+                return
+            try:
+                message = json.loads(text)
+                if not isinstance(message, dict):
+                    raise TypeError(f'expected an object, got {text!r}')
+                if message.get('type') == 'start':
+                    await self.run_session(ws, message)
+            except sqlite3.Error as e:   # 数据库被锁住等, 让学生重新开始
+                logger.warning(f'session failed: {e!r}')
+                await ws.send({'type': 'error', 'message': f'database error: {e}'})
+            except (HttpError, ValueError, KeyError, TypeError) as e:
+                await ws.send({'type': 'error', 'message': str(e)})
+
+    async def handle(self, request: Request, writer: asyncio.StreamWriter):
+        loop = asyncio.get_running_loop()
+        if request.path == '/':
+            write_response(writer, 200, PAGE.encode('utf-8'), 'text/html; charset=utf-8')
+        elif request.path == '/api/range' and request.method == 'GET':
+            operation = get_operation(request.query.get('operation'))
+            values = await loop.run_in_executor(None, Setting.load_range, request.query.get('username', ''),
+                                                operation.name)
+            write_json(writer, {'values': values})
+        elif request.path == '/api/range' and request.method == 'POST':
+            try:
+                data = json.loads(request.body)
+                operation = get_operation(data.get('operation'))
+                values = clamp_range(operation, [int(v) for v in data['values']])
+            except (ValueError, KeyError, TypeError) as e:
+                raise HttpError(400, str(e))
+            await loop.run_in_executor(None, Setting.save_range, str(data['username']), operation.name, values)
+            write_json(writer, {'values': values})
+        elif request.path == '/api/range':
+            raise HttpError(405)
+        else:
+            raise HttpError(404)
+
+    async def serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                    if request is None:
+                        break
+                    if request.path == '/ws':
+                        WebSocket.accept(request, writer)
+                        await self.websocket(WebSocket(reader, writer))
+                        break
+                    await self.handle(request, writer)
+                except HttpError as e:
+                    write_json(writer, {'error': str(e)}, e.status)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            logger.exception(e)
+        finally:
+            writer.close()
+
+
+PAGE = '''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>计算测试器</title>
+<style>
+body { font-family: sans-serif; text-align: center; }
+#question { font-size: 96px; margin: 32px; }
+#answer { font-size: 96px; width: 4em; text-align: center; }
+#score { white-space: pre; text-align: left; display: inline-block; }
+</style></head>
+<body>
+<div id="login">
+<input id="username" placeholder="用户名">
+<select id="operation">%s</select>
+<select id="seconds">%s</select>
+<button id="start">开始</button>
+</div>
+<progress id="progress" max="1" value="0" style="width: 100%%"></progress>
+<div id="question"></div>
+<input id="answer" type="number" style="display: none">
+<div id="score"></div>
+<script>
+const $ = (id) => document.getElementById(id);
+let ws = null, deadline = 0, total = 1;
+$('start').onclick = () => {
+  ws = new WebSocket((location.protocol === 'https:' ? 'wss://' : 'ws://') + location.host + '/ws');
+  ws.onopen = () => ws.send(JSON.stringify({type: 'start', username: $('username').value,
+    operation: $('operation').value, seconds: Number($('seconds').value)}));
+  ws.onmessage = (event) => {
+    const m = JSON.parse(event.data);
+    if (m.type === 'question') {
+      if (!deadline) { total = m.remaining; deadline = performance.now() + m.remaining * 1000; }
+      $('question').textContent = `${m.value1} ${m.operation} ${m.value2} =`; $('score').textContent = '';
+      $('answer').style.display = ''; $('answer').value = ''; $('answer').focus();
+    } else if (m.type === 'error' && m.fatal === false) {
+      $('score').textContent = m.message;
+    } else if (m.type === 'score' || m.type === 'error') {
+      $('answer').style.display = 'none'; $('question').textContent = '';
+      $('score').textContent = m.text || m.message; deadline = 0; ws.close();
+    }
+  };
+  $('score').textContent = '';
+};
+$('answer').onkeydown = (event) => {
+  if (event.key === 'Enter' && $('answer').value !== '' && ws)
+    ws.send(JSON.stringify({type: 'answer', answer: Number($('answer').value)}));
+};
+setInterval(() => {
+  if (deadline) $('progress').value = 1 - Math.max(deadline - performance.now(), 0) / 1000 / total;
+}, 50);
+</script>
+</body></html>
+''' % (''.join(f'<option value="{op.name}">{html.escape(op.value[0])}</option>' for op in OperationType),
+       ''.join(f'<option>{seconds}</option>' for seconds in range(60, 660, 60)))
+
+
+async def main(host: str, port: int):
+    get_store(legacy=DB)
+    get_history(legacy=DB)   # 在接受连接之前打开, 同时开始的会话不会各自去创建
+    classroom = Classroom()
+    server = await asyncio.start_server(classroom.serve, host, port)
+    logger.info(f'serving on http://{host}:{port}/')
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='0.0.0.0', help='监听地址')
+    parser.add_argument('--port', type=int, default=8080, help='监听端口')
+    args = parser.parse_args()
+    try:
+        asyncio.run(main(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
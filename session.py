@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+与界面无关的测试流程: 范围设置、抽题、判题、计分和保存记录.
+main.py 的对话框和 server.py 的网络会话都使用这里的 Session; BankSession 从二进制题库(bank.py)里出题.
+"""
+import enum
+import itertools
+import random
+import statistics
+import time
+from collections import deque
+from loguru import logger
+from typing import Deque, List, Optional, Tuple
+import instrument
+from bank import QuestionBank, open_bank
+from history import TestRecord, get_history
+from sampler import AdaptiveSampler, PairSampler, calculate
+from settings import get_store
+
+DB = 'database'
+BANK = '#'   # 题库练习记录的 opc 是 # 加题库标识, value1 是题库里的记录序号, value2 是空格位置
+
+
+class OperationType(enum.Enum):
+    ADDITION = ('+', '+')
+    SUBTRACTION = ('-', '-')
+    MULTIPLICATION = ('×', '*')
+    DIVISION = ('÷', '/')
+
+
+class Setting:
+
+    @classmethod
+    def load_range(cls, username, key: str) -> List[int]:
+        c: str = f'{username}/range'
+        result = get_store(legacy=DB).get(c, {}).get(key, [0, 0, 0, 0, 0, 0])
+        logger.debug(f'load_range: [{c}][{key}] = {result}')
+        return result
+
+    @classmethod
+    def save_range(cls, username, key: str, values: List[int]) -> None:
+        c: str = f'{username}/range'
+        store = get_store(legacy=DB)
+        ranges = store.get(c, {})
+        ranges[key] = list(values)
+        store.set(c, ranges)
+        logger.debug(f'save_range: [{c}][{key}] = {values}')
+
+
+def clamp_range(operation: OperationType, values: List[int]) -> List[int]:
+    """把 (x1, x2, y1, y2, a1, a2) 整理成有序的范围, 结果范围限制在操作数范围能得到的结果之内"""
+    x1, x2, y1, y2, answer1, answer2 = values
+    xs = x1, x2 = sorted([x1, x2])
+    ys = y1, y2 = sorted([y1, y2])
+    answers = sorted([answer1, answer2])
+    # 检查结果范围
+    if operation == OperationType.ADDITION:
+        a1 = x1 + y1
+        a2 = x2 + y2
+    elif operation == OperationType.SUBTRACTION:
+        a1 = x1 - y2
+        a2 = x2 - y1
+    elif operation == OperationType.MULTIPLICATION:
+        a1 = x1 * y1
+        a2 = x2 * y2
+    elif operation == OperationType.DIVISION:
+        if y2 == 0:
+            raise ValueError(f'{operation.name}: divisor range [{y1}, {y2}]')
+        a1 = x1 // y2
+        a2 = x2 // max(1, y1)
+    else:
+        raise ValueError(operation)
+    if a2 < 0:
+        raise ValueError(f'{operation.name}: answer range [{a1}, {a2}]')
+    answers = [max(max(0, a1), answers[0]), min(max(0, a2), answers[1])]
+    return xs + ys + answers
+
+
+class Session:
+    """
+    一次限时测试. 计时使用单调时钟, 墙上时间只用于保存记录.
+    finish 只会保存一次记录, 可以在任意线程调用.
+    """
+
+    def __init__(self, username: str, operation: Optional[OperationType], seconds: int = 60):
+        self.username: str = username
+        self.operation: Optional[OperationType] = operation
+        self.opc: str = operation.value[1] if operation is not None else BANK
+        self.seconds: int = seconds
+        self.sampler = self.create_sampler()
+        self.tests: List[TestRecord] = []
+        self.question: Optional[Tuple[int, int]] = None
+        self.queue: Deque[Tuple[int, int]] = deque()
+        self.shown_at: float = 0.0
+        self.shown_ns: int = 0
+        self.start_at: float = time.time()
+        self.started_ns: int = instrument.now()
+        self.duration_ns: int = seconds * 10 ** 9
+        self.finished: bool = False
+
+    def create_sampler(self) -> AdaptiveSampler:
+        values = Setting.load_range(self.username, self.operation.name)
+        analytics = get_history(legacy=DB).analytics
+        return AdaptiveSampler(PairSampler.get(self.opc, values), analytics.facts(self.username, self.opc),
+                               analytics.get(self.username, self.opc).mean_latency)
+
+    def elapsed(self) -> float:
+        """已经过去的比例, 0 ~ 1"""
+        return min((instrument.now() - self.started_ns) / self.duration_ns, 1.0)
+
+    def remaining(self) -> float:
+        """剩余秒数"""
+        return max(self.duration_ns - (instrument.now() - self.started_ns), 0) / 1e9
+
+    @property
+    def expired(self) -> bool:
+        return instrument.now() - self.started_ns >= self.duration_ns
+
+    def upcoming(self, n: int) -> List[Tuple[int, int]]:
+        """接下来的 n 道题目, next 按这个顺序出题(用于提前合成朗读)"""
+        while len(self.queue) < n:
+            self.queue.append(self.sampler.sample())
+        return list(itertools.islice(self.queue, n))
+
+    def next(self) -> Tuple[int, int]:
+        self.question = self.queue.popleft() if self.queue else self.sampler.sample()
+        self.shown_at = time.time()
+        self.shown_ns = instrument.now()
+        return self.question
+
+    def check(self, answer: int) -> TestRecord:
+        """判断当前题目的答案并记录"""
+        if self.question is None:
+            raise ValueError('no question')
+        value1, value2 = self.question
+        ref = calculate(self.opc, value1, value2)
+        correct = answer == ref
+        latency = (instrument.now() - self.shown_ns) / 1e9
+        record = TestRecord(value1, self.opc, value2, answer, ref, correct, latency, self.shown_at, self.shown_at + latency)
+        self.tests.append(record)
+        self.sampler.update(value1, value2, correct, latency, record.finish_at)
+        self.question = None
+        return record
+
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = True
+        history = get_history(legacy=DB)
+        history.append(self.username, self.tests)
+        logger.debug(f'save_score: [{self.username}] {len(self.tests)}')
+        logger.opt(lazy=True).debug('score_length: [{}] {}', lambda: self.username, lambda: history.count(self.username))
+
+    def report(self) -> str:
+        """本次成绩和历史统计"""
+        incorrect = [test for test in self.tests if not test.correct]
+        correct = [test for test in self.tests if test.correct]
+        total = len(self.tests)
+        rate_incorrect = len(incorrect) / max(1, total)
+        speed_correct = [test.latency for test in correct]
+        speed_correct = statistics.mean(speed_correct) if speed_correct else 0
+
+        oph, opc = self.operation.value
+        text = f'错误: {len(incorrect)} / {total} [{rate_incorrect:0.1%}]\n速度: {speed_correct:0.1f}秒\n'
+        for test in incorrect:
+            text += f'{test.value1} {oph} {test.value2} = {test.answer} [{test.ref}]\n'
+
+        analytics = get_history(legacy=DB).analytics
+        summary = analytics.get(self.username, opc)
+        latency = summary.latency
+        text += f'\n历史: {summary.total}题 正确率 {summary.accuracy:0.1%} [最近 {summary.trend_accuracy:0.1%}]\n'
+        text += f'速度: 平均 {summary.mean_latency:0.1f}秒 中位数 {latency.quantile(0.5):0.1f}秒 ' \
+                f'90% {latency.quantile(0.9):0.1f}秒 [最近 {summary.trend_latency:0.1f}秒]\n'
+        for fact, aggregate in analytics.weakest(self.username, opc):
+            text += f'{fact.replace(opc, f" {oph} ")} 错误 {aggregate.total - aggregate.correct} / {aggregate.total}\n'
+        return text
+
+
+class BankSampler:
+    """在题库里均匀抽题, 不与上一题重复"""
+
+    def __init__(self, size: int, r: Optional[random.Random] = None):
+        if size <= 0:
+            raise ValueError('empty question bank')
+        self.size: int = size
+        self.r: random.Random = r or random.Random()
+        self.last: int = -1
+
+    def sample(self) -> int:
+        while True:
+            i = self.r.randrange(self.size)
+            if i != self.last or self.size == 1:
+                self.last = i
+                return i
+
+    def update(self, *args):
+        pass
+
+
+class BankSession(Session):
+    """
+    从二进制题库里出题: 多个操作数、可能带括号的等式挖掉一个操作数.
+    题目只保存记录序号, 显示时才用 parts 渲染.
+    """
+
+    def __init__(self, username: str, filename: str, seconds: int = 60, r: Optional[random.Random] = None):
+        self.bank: QuestionBank = open_bank(filename)
+        self.r: Optional[random.Random] = r
+        super().__init__(username, None, seconds)
+        self.opc = BANK + self.bank.key   # 不同题库的记录序号互不相干, 分开统计
+
+    def create_sampler(self) -> BankSampler:
+        return BankSampler(len(self.bank), self.r)
+
+    def parts(self) -> Tuple[str, str]:
+        """当前题目空格前后的文字"""
+        return self.bank.parts(self.question)
+
+    def check(self, answer: int) -> TestRecord:
+        if self.question is None:
+            raise ValueError('no question')
+        i: int = self.question
+        ref = self.bank.answer(i)
+        correct = answer == ref or self.bank.check(i, answer)
+        latency = (instrument.now() - self.shown_ns) / 1e9
+        record = TestRecord(i, self.opc, self.bank.fields(i)[-1], answer, ref, correct, latency, self.shown_at,
+                            self.shown_at + latency)
+        self.tests.append(record)
+        self.question = None
+        return record
+
+    def report(self) -> str:
+        incorrect = [test for test in self.tests if not test.correct]
+        correct = [test for test in self.tests if test.correct]
+        total = len(self.tests)
+        speed_correct = statistics.mean([test.latency for test in correct]) if correct else 0
+        text = f'错误: {len(incorrect)} / {total} [{len(incorrect) / max(1, total):0.1%}]\n速度: {speed_correct:0.1f}秒\n'
+        for test in incorrect:
+            left, right = self.bank.parts(test.value1)
+            text += f'{left}{test.answer}{right} [{test.ref}]\n'
+
+        analytics = get_history(legacy=DB).analytics
+        summary = analytics.get(self.username, self.opc)
+        text += f'\n历史: {summary.total}题 正确率 {summary.accuracy:0.1%} [最近 {summary.trend_accuracy:0.1%}]\n'
+        text += f'速度: 平均 {summary.mean_latency:0.1f}秒 中位数 {summary.latency.quantile(0.5):0.1f}秒\n'
+        for fact, aggregate in analytics.weakest(self.username, self.opc):
+            left, right = self.bank.parts(int(fact.split(self.opc)[0]))
+            text += f'{left}_{right} 错误 {aggregate.total - aggregate.correct} / {aggregate.total}\n'
+        return text
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import atexit
+import copy
+import json
+import os
+import shelve
+import threading
+from loguru import logger
+from typing import Any, Dict, Optional, Set
+from writer import atomic_write
+
+SETTINGS = 'settings.json'
+
+
+class SettingStore:
+    """
+    进程内共享的设置: 启动时读一次文件, 之后读写都在内存里.
+    修改过的设置在 delay 秒内没有新的修改时写回磁盘(先写临时文件再替换), 退出时也会写回.
+    """
+
+    def __init__(self, filename: str = SETTINGS, legacy: Optional[str] = None, delay: float = 1.0):
+        self.filename: str = filename
+        self.delay: float = delay
+        self.lock = threading.RLock()
+        self.timer: Optional[threading.Timer] = None
+        self.dirty: Set[str] = set()
+        self.data: Dict[str, Any] = {}
+        if os.path.exists(filename):
+            with open(filename, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+        elif legacy is not None:
+            self.migrate(legacy)
+
+    def migrate(self, legacy: str):
+        """从旧的 shelve 数据库导入范围设置"""
+        try:
+            with shelve.open(legacy, flag='r') as db:
+                for key in db.keys():
+                    if key.endswith('/range') and isinstance(db[key], dict):
+                        self.data[key] = db[key]
+                        self.dirty.add(key)
+        except Exception as e:
+            logger.trace(e)
+        if self.dirty:
+            logger.info(f'migrate {sorted(self.dirty)} from {legacy} to {self.filename}')
+            self.flush()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self.lock:
+            return copy.deepcopy(self.data.get(key, default))
+
+    def set(self, key: str, value: Any):
+        with self.lock:
+            self.data[key] = copy.deepcopy(value)
+            self.dirty.add(key)
+            if self.timer is not None:
+                self.timer.cancel()
+            self.timer = threading.Timer(self.delay, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if not self.dirty:
+                return
+            atomic_write(self.filename, json.dumps(self.data, ensure_ascii=False, indent=1).encode('utf-8'))
+            logger.debug(f'flush settings: {sorted(self.dirty)}')
+            self.dirty.clear()
+
+
+_store: Optional[SettingStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store(legacy: Optional[str] = None) -> SettingStore:
+    """第一次调用时加载设置, 并在进程退出时写回; 多个线程同时第一次调用时也只加载一次"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SettingStore(legacy=legacy)
+                atexit.register(_store.flush)
+    return _store
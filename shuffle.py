@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import heapq
+import os
+import struct
+import tempfile
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+RECORD = struct.Struct('>QI')   # 8 字节哈希 + 4 字节长度, 后面跟 utf-8 内容
+
+
+def hash_key(line: str, seed: int = 0) -> int:
+    """64 位整数哈希, 相同 seed 下顺序可重现"""
+    digest = hashlib.blake2b(line.encode('utf-8'), digest_size=8, key=str(seed).encode('ascii')).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def _spill(chunk: List[Tuple[int, str]], directory: str) -> str:
+    chunk.sort()
+    fd, path = tempfile.mkstemp(suffix='.spill', dir=directory)
+    with os.fdopen(fd, 'wb', buffering=1 << 20) as f:
+        for key, line in chunk:
+            data = line.encode('utf-8')
+            f.write(RECORD.pack(key, len(data)))
+            f.write(data)
+    return path
+
+
+def _read_spill(path: str) -> Iterator[Tuple[int, str]]:
+    with open(path, 'rb', buffering=1 << 20) as f:
+        while True:
+            header = f.read(RECORD.size)
+            if not header:
+                break
+            key, length = RECORD.unpack(header)
+            yield key, f.read(length).decode('utf-8')
+
+
+def shuffle(lines: Iterable[str], seed: int = 0, chunk_size: int = 1 << 20, directory: Optional[str] = None) -> Iterator[str]:
+    """
+    按哈希值排序实现的确定性乱序, 可以处理比内存大的题库:
+    每 chunk_size 行排序后写入临时文件, 最后多路归并. 题库不超过 chunk_size 行时不写临时文件.
+    """
+    chunk: List[Tuple[int, str]] = []
+    with tempfile.TemporaryDirectory(prefix='shuffle_', dir=directory) as tmp:
+        spills: List[str] = []
+        for line in lines:
+            chunk.append((hash_key(line, seed), line))
+            if len(chunk) >= chunk_size:
+                spills.append(_spill(chunk, tmp))
+                chunk = []
+        if not spills:
+            chunk.sort()
+            for key, line in chunk:
+                yield line
+            return
+        if chunk:
+            spills.append(_spill(chunk, tmp))
+            chunk = []
+        for key, line in heapq.merge(*[_read_spill(path) for path in spills]):
+            yield line
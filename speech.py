@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+朗读题目: pyttsx3 只在一个后台线程里使用, 提前把接下来的题目合成为音频文件, 界面线程只负责播放.
+音频文件按内容(文字和语音参数)的哈希命名, 保存在磁盘缓存里, 超过容量时删除最久没用过的文件.
+"""
+import hashlib
+import itertools
+import os
+import queue
+import threading
+from collections import OrderedDict
+from loguru import logger
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import pyttsx3
+except ImportError:
+    pyttsx3 = None
+
+SPEECH = 'speech'
+SPOKEN: Dict[str, str] = {'+': '加', '-': '减', '*': '乘', '/': '除以'}
+SPEAK, PRERENDER = 0, 1   # 优先级, 数字小的先处理
+
+
+def question_text(value1: int, opc: str, value2: int) -> str:
+    return f'{value1} {SPOKEN[opc]} {value2} 等于'
+
+
+class AudioCache:
+    """按内容寻址的音频文件缓存, 总大小不超过 max_bytes"""
+
+    def __init__(self, directory: str = SPEECH, max_bytes: int = 64 << 20, suffix: str = '.wav'):
+        self.directory: str = directory
+        self.max_bytes: int = max_bytes
+        self.suffix: str = suffix
+        self.lock = threading.Lock()
+        self.files: 'OrderedDict[str, int]' = OrderedDict()   # key -> 文件大小, 最近使用的在最后
+        self.size: int = 0
+        os.makedirs(directory, exist_ok=True)
+        entries = []
+        for entry in os.scandir(directory):
+            if entry.name.endswith(suffix) and '.part' not in entry.name:
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name[:-len(suffix)], stat.st_size))
+        for _, key, size in sorted(entries):
+            self.files[key] = size
+            self.size += size
+
+    @staticmethod
+    def key(text: str, voice: str) -> str:
+        return hashlib.blake2b(f'{voice}\0{text}'.encode('utf-8'), digest_size=16).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.suffix)
+
+    def get(self, key: str) -> Optional[str]:
+        """命中时返回文件名, 并记为最近使用"""
+        with self.lock:
+            if key not in self.files:
+                return None
+            self.files.move_to_end(key)
+        path = self.path(key)
+        try:
+            os.utime(path)   # 重新启动后按修改时间恢复使用顺序
+        except OSError:
+            with self.lock:
+                self.size -= self.files.pop(key, 0)
+            return None
+        return path
+
+    def put(self, key: str, tmp: str) -> str:
+        """把合成好的临时文件放进缓存"""
+        path = self.path(key)
+        os.replace(tmp, path)
+        size = os.path.getsize(path)
+        with self.lock:
+            self.size += size - self.files.pop(key, 0)
+            self.files[key] = size
+            while self.size > self.max_bytes and len(self.files) > 1:
+                old, old_size = self.files.popitem(last=False)
+                self.size -= old_size
+                try:
+                    os.remove(self.path(old))
+                except OSError as e:
+                    logger.trace(e)
+        return path
+
+
+class Speaker:
+    """
+    后台合成线程. speak 和 prerender 都不会阻塞调用线程:
+    合成好的文件通过 on_ready(text, path) 通知(在后台线程里调用), 没有 on_ready 时直接用 say 朗读.
+    """
+
+    def __init__(self, cache: Optional[AudioCache] = None, rate: int = 150, volume: float = 1.0, voice: str = 'zh',
+                 on_ready: Optional[Callable[[str, str], None]] = None,
+                 engine_factory: Optional[Callable] = None):
+        self.cache: AudioCache = cache or AudioCache()
+        self.properties: Dict[str, object] = {'rate': rate, 'volume': volume, 'voice': voice}
+        self.voice: str = f'{voice}/{rate}/{volume}'
+        self.on_ready = on_ready
+        self.engine_factory = engine_factory or (pyttsx3.init if pyttsx3 is not None else None)
+        if self.engine_factory is None:
+            raise RuntimeError('pyttsx3 is not installed')
+        self.jobs: 'queue.PriorityQueue[Tuple[int, int, Optional[str]]]' = queue.PriorityQueue()
+        self.counter = itertools.count()
+        self.pending: Dict[str, int] = {}   # 排队中的文字 -> 优先级
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, name='speaker', daemon=True)
+        self.thread.start()
+
+    def submit(self, text: str, priority: int):
+        with self.lock:
+            if self.pending.get(text, PRERENDER + 1) <= priority:
+                return
+            self.pending[text] = priority
+        self.jobs.put((priority, next(self.counter), text))
+
+    def speak(self, text: str) -> Optional[str]:
+        """已经合成过时直接返回文件名, 否则排在最前面合成, 完成后调用 on_ready"""
+        path = self.cache.get(self.cache.key(text, self.voice))
+        if path is None or self.on_ready is None:
+            self.submit(text, SPEAK)
+        return path
+
+    def prerender(self, texts: List[str]):
+        """在空闲时提前合成, 已经缓存的跳过"""
+        for text in texts:
+            if self.cache.get(self.cache.key(text, self.voice)) is None:
+                self.submit(text, PRERENDER)
+
+    def close(self):
+        self.jobs.put((-1, next(self.counter), None))
+        self.thread.join()
+
+    def run(self):
+        engine = self.engine_factory()
+        for name, value in self.properties.items():
+            engine.setProperty(name, value)
+        while True:
+            priority, _, text = self.jobs.get()
+            if text is None:
+                break
+            with self.lock:
+                if self.pending.get(text) != priority:
+                    continue   # 同一段文字已经按更高的优先级处理过
+                del self.pending[text]
+            on_ready = self.on_ready
+            try:
+                if priority == SPEAK and on_ready is None:
+                    engine.say(text)
+                    engine.runAndWait()
+                    continue
+                key = self.cache.key(text, self.voice)
+                path = self.cache.get(key)
+                if path is None:
+                    tmp = os.path.join(self.cache.directory, f'{key}.part{self.cache.suffix}')
+                    engine.save_to_file(text, tmp)
+                    engine.runAndWait()
+                    path = self.cache.put(key, tmp)
+                if priority == SPEAK:
+                    on_ready(text, path)
+            except Exception as e:
+                logger.exception(e)
+        engine.stop()
+
+
+_speaker: Optional[Speaker] = None
+
+
+def get_speaker(on_ready: Optional[Callable[[str, str], None]] = None) -> Optional[Speaker]:
+    """没有安装 pyttsx3 时返回 None"""
+    global _speaker
+    if _speaker is None and pyttsx3 is not None:
+        _speaker = Speaker(on_ready=on_ready)
+    if _speaker is not None:
+        _speaker.on_ready = on_ready
+    return _speaker
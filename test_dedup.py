@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from dedup import Deduplicator, canonical
+
+
+def test_commutative_and_redundant_brackets():
+    assert canonical('3+5= _ ') == canonical('5+3= _ ') == canonical(' _ =3+5') == canonical('(3+5)= _ ')
+    assert canonical('8+(5-2)= _ ') == canonical('8+5-2= _ ')
+    assert canonical('2*(3/4)= _ ') == canonical('2*3/4= _ ')
+    assert canonical('3+5= _ ') != canonical('8-5= _ ')
+
+
+def test_brackets_after_minus_are_kept():
+    assert canonical('8-(5-2)= _ ') != canonical('8-5+2= _ ')
+    assert canonical('8-(5+2)= _ ') != canonical('8-5-2= _ ')
+    assert canonical('8-(2+5)= _ ') == canonical('8-(5+2)= _ ')
+
+
+def test_brackets_after_divide_are_kept():
+    assert canonical('8/(4/2)= _ ') != canonical('8*2/4= _ ')
+    assert canonical('8/(4*2)= _ ') != canonical('8/4/2= _ ')
+
+
+def test_deduplicator_keeps_bracket_exercises():
+    deduplicator = Deduplicator('set')
+    questions = ['8-(5-2)= _ ', '8-5+2= _ ', '8/(4/2)= _ ', '8*2/4= _ ', '2+8-5= _ ']
+    assert deduplicator.filter(questions) == questions[:4]
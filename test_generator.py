@@ -1,13 +1,23 @@
 # -*- coding: utf-8 -*-
-import hashlib
+import argparse
+import gzip
+import html
+import io
 import itertools
-import math
+import multiprocessing
 import os
-import pdfkit
+import random
 import re
-from bs4 import BeautifulSoup
-from lxml.etree import Element, HTML, SubElement, QName, tostring
-from typing import Dict, List, Union
+import shutil
+from collections import Counter
+from loguru import logger
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple, Union
+from bank import BankWriter, QuestionBank
+from dedup import Deduplicator
+from expression import SliceTable, get_templates
+from pdf import render_pdf
+from shuffle import shuffle
+from writer import COMPRESSIONS, Progress, QuestionWriter
 
 
 class Config:
@@ -32,135 +42,398 @@ class Config:
         if cls.bracket:
             cls.length_formula += 2
 
+    @classmethod
+    def snapshot(cls) -> Dict[str, Any]:
+        return {k: getattr(cls, k) for k in ['value_min', 'value_max', 'numbers', 'operates', 'bracket']}
+
+    @classmethod
+    def restore(cls, snapshot: Dict[str, Any]):
+        for k, v in snapshot.items():
+            setattr(cls, k, v)
+        cls.validate()
+
 
-def generate_csv():
+def generate_csv(workers: int = 1, compression: Optional[str] = None, resume: bool = False, engine: str = 'python',
+                 dedup: Optional[str] = None, dedup_error: float = 1e-6, format: str = 'csv') -> str:
+    """
+    dedup 为 set 或 bloom 时只保留规范形式第一次出现的题目, 文件名带 .dedup.
+    format 为 bin 时输出 bank 模块的二进制题库(.qbank), 只支持单进程、python 引擎、不压缩、不续写.
+    """
     Config.validate()
+    assert format in ('csv', 'bin'), format
+    if format == 'bin' and (workers > 1 or compression or resume or engine != 'python'):
+        raise ValueError('the binary bank is written by a single python worker without compression or resume')
 
     operates: str = ''.join(Config.operates).translate(str.maketrans('+-*/', '\u002B\u002D\u00D7\u00F7'))
-    filename: str = f'test_{Config.value_min}_{Config.value_max}_{operates}_{Config.numbers}.{int(Config.bracket) if Config.numbers > 3 else 0}.csv'
-    with open(filename, 'w', encoding='utf-8') as f:
-        for i, question in enumerate(generate_one()):
-            f.write(f'{question}\n')
-            if i % 1000 == 0 and i > 0:
-                print(i, question)
+    filename: str = f'test_{Config.value_min}_{Config.value_max}_{operates}_{Config.numbers}.{int(Config.bracket) if Config.numbers > 3 else 0}'
+    filename += f'{".dedup" if dedup else ""}' + ('.qbank' if format == 'bin' else f'.csv{COMPRESSIONS[compression]}')
+    total: int = (Config.value_max - Config.value_min + 1) ** Config.numbers
+    config: Dict[str, Any] = {**Config.snapshot(), 'dedup': dedup} if dedup else Config.snapshot()
+    if format == 'bin':
+        return generate_bank(filename, config, total, dedup, dedup_error)
+    with QuestionWriter(filename, config, total, compression=compression, resume=resume) as writer:
+        deduplicator: Optional[Deduplicator] = get_deduplicator(dedup, dedup_error)
+        if deduplicator:
+            if writer.start:   # 续写时先把已经写出的题目放进去重表
+                for question in read_questions(filename):
+                    deduplicator.add(question)
+        if workers > 1:
+            generate_csv_parallel(writer, workers, engine, deduplicator)
+        else:
+            for index, questions in get_indexed_generator(engine)(start=writer.start):
+                writer.write(deduplicator.filter(questions) if deduplicator else questions)
+                writer.completed(index)
+        if deduplicator:
+            logger.info(f'dedup: {deduplicator.total - deduplicator.dropped}/{deduplicator.total} questions kept')
+    return filename
+
+
+def get_deduplicator(dedup: Optional[str], dedup_error: float) -> Optional[Deduplicator]:
+    if not dedup:
+        return None
+    capacity = int(estimate_questions(2000) * 1.1) if dedup == 'bloom' else 0
+    return Deduplicator(dedup, capacity, dedup_error)
+
+
+def generate_bank(filename: str, config: Dict[str, Any], total: int, dedup: Optional[str] = None,
+                  dedup_error: float = 1e-6) -> str:
+    """按 CSV 的顺序把等式和空格位置写成二进制题库, 不生成题目文字(去重时除外)"""
+    deduplicator: Optional[Deduplicator] = get_deduplicator(dedup, dedup_error)
+    progress = Progress(total)
+    with BankWriter(filename, config) as writer:
+        for index, equations in generate_equations():
+            if deduplicator:
+                questions = [(es, blank) for es in equations
+                             for blank, question in enumerate(get_question_list(es)) if deduplicator.add(question)]
+            else:
+                questions = [(es, blank) for es in equations for blank in range(Config.numbers)]
+            writer.write(index, questions)
+            progress.update(index, len(questions), len(questions) * writer.record.size)
+        progress.report(progress.total)
+    if deduplicator:
+        logger.info(f'dedup: {deduplicator.total - deduplicator.dropped}/{deduplicator.total} questions kept')
+    return filename
+
+
+def generate_csv_parallel(writer: QuestionWriter, workers: int, engine: str = 'python',
+                          deduplicator: Optional[Deduplicator] = None):
+    """按首个操作数分片, 多进程生成后按分片顺序合并, 结果与单进程完全相同; 去重在合并时进行"""
+    size: int = Config.value_max - Config.value_min + 1
+    block: int = size ** (Config.numbers - 1)
+    directory: str = f'{writer.filename}.shards'
+    os.makedirs(directory, exist_ok=True)
+    shards: List[Tuple[str, int, int]] = []
+    for i in range(writer.start // block, size):
+        shards.append((os.path.join(directory, f'{i}.csv'), max(writer.start, i * block), (i + 1) * block))
+    try:
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(Config.snapshot(), engine)) as pool:
+            for path, stop, count in pool.imap(_generate_shard, shards):
+                if deduplicator is not None:
+                    with open(path, 'r', encoding='utf-8') as shard:
+                        while True:
+                            lines = list(itertools.islice(shard, 1 << 14))
+                            if not lines:
+                                break
+                            writer.write(deduplicator.filter(line.rstrip('\n') for line in lines))
+                else:
+                    with open(path, 'rb') as shard:
+                        for data in iter(lambda: shard.read(1 << 20), b''):
+                            writer.write_bytes(data, count)
+                            count = 0
+                os.remove(path)
+                writer.completed(stop - 1)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+_worker_table: Optional[SliceTable] = None
+_worker_compact: Optional[Dict[int, List[Tuple[Any, ...]]]] = None
+_worker_engine: str = 'python'
+
+
+def _init_worker(snapshot: Dict[str, Any], engine: str):
+    """每个进程只建一次缓存, 之后的分片共用: python 的 SliceTable, numpy 的各模板有效行"""
+    global _worker_table, _worker_compact, _worker_engine
+    Config.restore(snapshot)
+    _worker_engine = engine
+    if engine == 'numpy':
+        from vectorized import get_compacted
+        _worker_compact = get_compacted()
+    else:
+        _worker_table = SliceTable(tuple(Config.operates), Config.bracket)
 
 
-def generate_one():
+def _generate_shard(shard: Tuple[str, int, int]) -> Tuple[str, int, int]:
+    path, start, stop = shard
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        if _worker_engine == 'python':
+            indexed = generate_indexed(start=start, stop=stop, table=_worker_table)
+        else:
+            indexed = get_indexed_generator(_worker_engine)(start=start, stop=stop, compact=_worker_compact)
+        for index, questions in indexed:
+            f.writelines(f'{question}\n' for question in questions)
+            count += len(questions)
+    return path, stop, count
+
+
+def get_indexed_generator(engine: str) -> Callable[..., Iterator[Tuple[int, List[str]]]]:
+    """python: 逐个组合计算; numpy: vectorized 模块按模板批量计算, 结果相同"""
+    if engine == 'numpy':
+        from vectorized import generate_indexed_numpy
+        return generate_indexed_numpy
+    assert engine == 'python', engine
+    return generate_indexed
+
+
+def generate_one(start: int = 0, stop: Optional[int] = None, table: Optional[SliceTable] = None) -> Iterator[str]:
+    for index, questions in generate_indexed(start, stop, table):
+        yield from questions
+
+
+def generate_indexed(start: int = 0, stop: Optional[int] = None,
+                     table: Optional[SliceTable] = None) -> Iterator[Tuple[int, List[str]]]:
+    """从第 start 个操作数组合生成到第 stop 个(不含), 每个组合产出一次 (序号, 题目列表)"""
+    for i, equations in generate_equations(start, stop, table):
+        yield i, [question for es in equations for question in get_question_list(es)]
+
+
+def generate_equations(start: int = 0, stop: Optional[int] = None,
+                       table: Optional[SliceTable] = None) -> Iterator[Tuple[int, List[List[Union[int, str]]]]]:
+    """与 generate_indexed 相同, 但产出成立的等式(挖空之前), 二进制题库直接保存等式"""
     values: List[int] = [v for v in range(Config.value_min, Config.value_max + 1)]
-    for i, vs in enumerate(itertools.product(*[values] * Config.numbers)):
-        vs: List[int] = list(vs)
+    if table is None:
+        table = SliceTable(tuple(Config.operates), Config.bracket)
+    products = get_product_list(values, Config.numbers, start)
+    if stop is not None:
+        products = itertools.islice(products, max(0, stop - start))
+    for i, vs in enumerate(products, start):
+        equations: List[List[Union[int, str]]] = []
         for equal_position in range(1, Config.numbers):
-            left_part: List[int] = vs[:equal_position]
-            right_part: List[int] = vs[equal_position:]
-
-            left_extended = []  # 左侧组合
-            for left in get_operated_list(left_part):
-                if eval(stringify(left)) >= 0:
-                    left_extended.append(left)
-                if Config.bracket:
-                    for x in get_bracketed_list(left):
-                        if eval(stringify(x)) >= 0:
-                            left_extended.append(x)
-
-            right_extended = []  # 右侧组合
-            for right in get_operated_list(right_part):
-                if eval(stringify(right)) >= 0:
-                    right_extended.append(right)
-                if Config.bracket:
-                    for x in get_bracketed_list(right):
-                        if eval(stringify(x)) >= 0:
-                            right_extended.append(x)
-
-            for a, b in itertools.product(left_extended, right_extended):
-                if eval(stringify(a)) == eval(stringify(b)) >= 0:   # 等式成立
-                    formula: str = f'{stringify(a)}={stringify(b)}'
+            left_part: Tuple[int, ...] = vs[:equal_position]
+            right_part: Tuple[int, ...] = vs[equal_position:]
+            left_extended = table.get(left_part).forms  # 左侧组合
+            right_indexed = table.get(right_part).index  # 右侧组合, 按结果分组
+            for a, value in left_extended:
+                for b in right_indexed.get(value, ()):   # 等式成立
                     # 生成题目
-                    es: List[Union[int, str]] = [*a, '=', *b]
-                    for j, e in enumerate(es):
-                        if isinstance(e, int):
-                            question = es.copy()
-                            question[j] = ' ' + '_' * (Config.length_formula - len(stringify(es[:j])) - len(stringify(es[j + 1:])) - 2) + ' '
-                            yield stringify(question)
-
-
-def get_operated_list(part: List[int]) -> List[Union[int, str]]:
-    for operates in itertools.product(*[Config.operates] * (len(part) - 1)):
-        _part: List[Union[int, str]] = part.copy()
-        for i, operate in zip(range(len(part) - 1, 0, -1), operates[::-1]):
-            _part.insert(i, operate)
-        yield _part
-
-
-def get_bracketed_list(part: List[Union[int, str]]) -> List[Union[int, str]]:
-    numbers: int = math.ceil(len(part) / 2)
-    index_left: List[int] = list(range(0, numbers * 2 - 2, 2))    # 左半括号位置
-    index_right: List[int] = list(range(3, numbers * 2, 2))    # 右半括号位置
-    # assert len(index_left) == len(index_right)
-    for l, r in itertools.product(index_left, index_right):
-        if 2 <= r - l < len(part):
-            _part: List[Union[int, str]] = part.copy()
-            _part.insert(r, ')')
-            _part.insert(l, '(')
-            if eval(stringify(_part[l + 1: r + 1])) >= 0:   # 括号里的结果不小于0
-                yield _part
+                    equations.append([*a.tokens(left_part), '=', *b.tokens(right_part)])
+        yield i, equations
 
 
-def stringify(value: List[Union[int, str]]) -> str:
-    return ''.join([str(v) for v in value])
+def get_product_list(values: List[int], numbers: int, start: int = 0) -> Iterator[Tuple[int, ...]]:
+    """与 itertools.product(*[values] * numbers) 相同, 但直接从第 start 个组合开始"""
+    block: int = len(values) ** (numbers - 1)
+    first, offset = divmod(start, block)
+    if offset:
+        for rest in get_product_list(values, numbers - 1, offset):
+            yield (values[first], *rest)
+        first += 1
+    yield from itertools.product(values[first:], *[values] * (numbers - 1))
+
+
+def count_questions() -> int:
+    """
+    不生成题目, 直接算出题目总数.
+
+    等号左右两侧的组合互相独立, 所以 k 个操作数的左侧与 numbers-k 个操作数的右侧能组成的等式数
+    等于 Σ_v C_k[v] * C_(numbers-k)[v], 其中 C_k[v] 是所有 k 个操作数组合里结果为 v 的表达式个数;
+    每个等式再按挖空位置生成 numbers 道题目.
+    """
+    Config.validate()
+    counts: Dict[int, Counter] = {k: get_value_counts(k) for k in range(1, Config.numbers)}
+    return Config.numbers * sum(
+        sum(c * counts[Config.numbers - k].get(v, 0) for v, c in counts[k].items()) for k in range(1, Config.numbers)
+    )
 
 
-def generate_html(filename: str):
-    r = re.findall(r'^test_([+-]?\d+)_([+-]?\d+)_([^_]+)_(\d+)\.(\d).csv$', filename.lower())[0]
-    Config.value_min = int(r[0])
-    Config.value_max = int(r[1])
-    Config.operates = list(r[2].translate(str.maketrans('\u002B\u002D\u00D7\u00F7', '+-*/')))
-    Config.numbers = int(r[3])
-    Config.bracket = bool(r[4])
+def estimate_questions(samples: int = 10000, seed: int = 0) -> float:
+    """与 count_questions 相同, 但组合数超过 samples 的片段长度用随机抽样估计 C_k"""
     Config.validate()
+    r = random.Random(seed)
+    total: float = 0
+    for k in range(1, Config.numbers):
+        left = get_value_counts(k, samples, r)
+        right = get_value_counts(Config.numbers - k, samples, r)   # 独立抽样, 乘积才是无偏的
+        total += sum(c * right.get(v, 0) for v, c in left.items())
+    return Config.numbers * total
+
+
+def estimate_bytes(questions: float) -> float:
+    """每道题目都补齐到 length_formula 个字符"""
+    return questions * (Config.length_formula + 1)
+
+
+def get_value_counts(length: int, samples: Optional[int] = None, r: Optional[random.Random] = None) -> Counter:
+    """所有 length 个操作数的组合里, 各个非负结果对应的表达式个数; 组合数超过 samples 时按抽样放大"""
+    values: List[int] = [v for v in range(Config.value_min, Config.value_max + 1)]
+    templates = get_templates(length, tuple(Config.operates), Config.bracket)
+    size: int = len(values) ** length
+    if samples is None or size <= samples:
+        parts, scale = itertools.product(*[values] * length), 1
+    else:
+        parts, scale = (tuple(r.choices(values, k=length)) for _ in range(samples)), size / samples
+    counts = Counter()
+    for part in parts:
+        for template in templates:
+            value = template.evaluate(part)
+            if value is not None and value >= 0:
+                counts[value] += scale
+    return counts
+
 
-    with open(filename, 'r', encoding='utf-8') as f:
-        questions: List[str] = f.read().splitlines()
-    # random.shuffle(questions)
-    questions.sort(key=lambda x: hashlib.md5(x.encode('utf-8')).hexdigest())
+def get_question_list(es: List[Union[int, str]]) -> Iterator[str]:
+    for j, e in enumerate(es):
+        if isinstance(e, int):
+            question = es.copy()
+            question[j] = ' ' + '_' * (Config.length_formula - len(stringify(es[:j])) - len(stringify(es[j + 1:])) - 2) + ' '
+            yield stringify(question)
 
-    page_source: str = '''
-<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.1//EN" "http://www.w3.org/TR/xhtml11/DTD/xhtml11.dtd">
+
+def stringify(value: List[Union[int, str]]) -> str:
+    return ''.join([str(v) for v in value])
+
+
+HTML_HEAD: str = '''<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.1//EN" "http://www.w3.org/TR/xhtml11/DTD/xhtml11.dtd">
 <html lang="en">
 <head>
     <meta charset="UTF-8">
-    <title>Title</title>
+    <title>{title}</title>
     <style type="text/css">
-        * {font-family: "Courier New", courier, monospace;}
-        .questions {width: 800px;}
-        .question {float: left; margin: 10px 20px 10px 20px; font-size: 20px;}
+        * {{font-family: "Courier New", courier, monospace;}}
+        .questions {{width: 800px; overflow: hidden; page-break-after: always;}}
+        .question {{float: left; margin: 10px 20px 10px 20px; font-size: 20px;}}
     </style>
 </head>
 <body>
-    <div class="questions"></div>
-</body>
+'''
+HTML_TAIL: str = '''</body>
 </html>
 '''
-    tree = HTML(page_source)
-    e: Element = tree.xpath('//div[@class="questions"]')[0]
-    tree.xpath('//head/title')[0].text = filename
-    for question in questions:
-        q = Element('pre', attrib={'class': 'question'})
-        q.text = question
-        e.append(q)
-    page_source: str = tostring(tree, encoding='utf-8', pretty_print=True).decode('utf-8')
-    soup = BeautifulSoup(page_source, 'html.parser')
-    with open(f'{os.path.splitext(filename)[0]}.html', 'w', encoding='utf-8') as f:
-        f.write(soup.prettify())
-
-    from pdfkit.configuration import Configuration
-    configuration = Configuration(wkhtmltopdf='./wkhtmltopdf.exe')
-    pdf = pdfkit.PDFKit(soup.prettify(), type_='string', configuration=configuration)
-    pdf.to_pdf('out.pdf')
-    # pdfkit.from_string(soup.prettify(), f'{os.path.splitext(filename)[0]}.pdf')
+
+
+def parse_filename(filename: str) -> str:
+    """按题库文件名设置 Config, 返回去掉 .csv(.gz/.zst) 或 .qbank 后的文件名"""
+    r = re.findall(r'^(.*?test_([+-]?\d+)_([+-]?\d+)_([^_]+)_(\d+)\.(\d)(?:\.dedup)?)\.(?:csv(?:\.gz|\.zst)?|qbank)$',
+                   filename.lower())[0]
+    Config.value_min = int(r[1])
+    Config.value_max = int(r[2])
+    Config.operates = list(r[3].translate(str.maketrans('\u002B\u002D\u00D7\u00F7', '+-*/')))
+    Config.numbers = int(r[4])
+    Config.bracket = bool(int(r[5]))
+    Config.validate()
+    return filename[:len(r[0])]
+
+
+def read_questions(filename: str) -> Iterator[str]:
+    """逐行读取题库, 支持 writer 输出的 gzip/zstd 压缩文件和二进制题库"""
+    if filename.endswith('.qbank'):
+        with QuestionBank(filename) as bank:
+            yield from bank
+        return
+    if filename.endswith('.gz'):
+        f = gzip.open(filename, 'rt', encoding='utf-8')
+    elif filename.endswith('.zst'):
+        import zstandard
+        f = io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(filename, 'rb'), closefd=True), encoding='utf-8')
+    else:
+        f = open(filename, 'r', encoding='utf-8')
+    with f:
+        for line in f:
+            yield line.rstrip('\n')
+
+
+def render_html(questions: Iterable[str], stem: str, title: str, per_page: int = 80, per_file: int = 0) -> List[str]:
+    """
+    边读边写 HTML, 内存占用与题库大小无关.
+    每 per_page 道题目一页(打印时分页), per_file 大于 0 时每 per_file 道题目一个文件, 返回写出的文件名.
+    """
+    filenames: List[str] = []
+    f: Optional[TextIO] = None
+
+    def next_file():
+        nonlocal f
+        if f is not None:
+            f.write(f'</div>\n{HTML_TAIL}')
+            f.close()
+        filenames.append(f'{stem}_{len(filenames) + 1}.html' if per_file else f'{stem}.html')
+        f = open(filenames[-1], 'w', encoding='utf-8', buffering=1 << 20)
+        f.write(HTML_HEAD.format(title=html.escape(title)))
+        f.write('<div class="questions">\n')
+
+    for i, question in enumerate(questions):
+        if f is None or per_file and i % per_file == 0:
+            next_file()
+        elif i % per_page == 0:
+            f.write('</div>\n<div class="questions">\n')
+        f.write(f'<pre class="question">{html.escape(question)}</pre>\n')
+    if f is None:
+        next_file()
+    f.write(f'</div>\n{HTML_TAIL}')
+    f.close()
+    return filenames
+
+
+def generate_html(filename: str, per_page: int = 80, per_file: int = 0, seed: int = 0,
+                  workers: int = 1, backend: str = 'python'):
+    """HTML 和 PDF 的文件名都取自题库文件名; 题库只乱序一次, HTML 和 PDF 使用同样的顺序"""
+    stem: str = parse_filename(filename)
+    questions: Iterator[str] = shuffle(read_questions(filename), seed=seed)
+
+    if backend == 'wkhtmltopdf':
+        import pdfkit
+        from pdfkit.configuration import Configuration
+        filenames: List[str] = render_html(questions, stem, filename, per_page=per_page, per_file=per_file)
+        configuration = Configuration(wkhtmltopdf=shutil.which('wkhtmltopdf') or './wkhtmltopdf.exe')
+        pdfkit.from_file(filenames, f'{stem}.pdf', configuration=configuration)
+        return
+    shuffled: str = f'{stem}.shuffled'   # 写 HTML 时顺便保存乱序后的题目, PDF 直接读取
+    try:
+        with open(shuffled, 'w', encoding='utf-8', buffering=1 << 20) as f:
+            render_html(tee_lines(questions, f), stem, filename, per_page=per_page, per_file=per_file)
+        render_pdf(read_questions(shuffled), f'{stem}.pdf', filename, Config.length_formula, per_page=per_page,
+                   workers=workers)
+    finally:
+        if os.path.exists(shuffled):
+            os.remove(shuffled)
+
+
+def tee_lines(lines: Iterable[str], f: TextIO) -> Iterator[str]:
+    for line in lines:
+        f.write(f'{line}\n')
+        yield line
 
 
 if __name__ == '__main__':
-    generate_csv()
-    generate_html('test_0_20_+-_3.0.csv')
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=1, help='生成题目的进程数')
+    parser.add_argument('--compression', choices=['gzip', 'zstd'], default=None, help='压缩输出的题库')
+    parser.add_argument('--resume', action='store_true', help='从上次中断的检查点继续生成')
+    parser.add_argument('--engine', choices=['python', 'numpy'], default='python', help='计算引擎')
+    parser.add_argument('--count', action='store_true', help='只统计题目数和文件大小, 不生成')
+    parser.add_argument('--estimate', type=int, default=0, metavar='SAMPLES', help='用抽样估计代替精确统计')
+    parser.add_argument('--max-questions', type=float, default=0, help='题目数超过该值时不生成')
+    parser.add_argument('--max-bytes', type=float, default=0, help='文件大小超过该值时不生成')
+    parser.add_argument('--per-page', type=int, default=80, help='HTML 每页题目数')
+    parser.add_argument('--per-file', type=int, default=0, help='HTML 每个文件的题目数, 0 表示只输出一个文件')
+    parser.add_argument('--seed', type=int, default=0, help='题目乱序的种子')
+    parser.add_argument('--dedup', choices=['set', 'bloom'], default=None,
+                        help='去掉等价的题目: set 精确, bloom 内存固定但可能误删极少数题目')
+    parser.add_argument('--dedup-error', type=float, default=1e-6, help='bloom 的误删率')
+    parser.add_argument('--format', choices=['csv', 'bin'], default='csv',
+                        help='bin: 输出定长记录的二进制题库(.qbank), 练习时按需读取')
+    parser.add_argument('--pdf-backend', choices=['python', 'wkhtmltopdf'], default='python', help='PDF 生成方式')
+    args = parser.parse_args()
+    if args.count or args.max_questions or args.max_bytes:
+        questions = estimate_questions(args.estimate) if args.estimate else count_questions()
+        print(f'questions: {questions:0.0f}, bytes: {estimate_bytes(questions):0.0f}')
+        if args.max_questions and questions > args.max_questions or args.max_bytes and estimate_bytes(questions) > args.max_bytes:
+            raise SystemExit('config exceeds the budget')
+        if args.count:
+            raise SystemExit(0)
+    filename = generate_csv(workers=args.workers, compression=args.compression, resume=args.resume, engine=args.engine,
+                            dedup=args.dedup, dedup_error=args.dedup_error, format=args.format)
+    generate_html(filename, per_page=args.per_page, per_file=args.per_file, seed=args.seed,
+                  workers=args.workers, backend=args.pdf_backend)
     # generate_html('test_0_20_+-_4.0.csv')
     # generate_html('test_0_20_+-_4.1.csv')
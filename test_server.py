@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import base64
+import json
+import os
+import sqlite3
+import struct
+from typing import Awaitable, Callable, Tuple
+import pytest
+import history
+import server
+import settings
+from server import Classroom
+from session import Setting
+
+
+async def read_message(reader: asyncio.StreamReader) -> dict:
+    header = await reader.readexactly(2)
+    length = header[1] & 0x7f
+    if length == 126:
+        length, = struct.unpack('!H', await reader.readexactly(2))
+    return json.loads(await reader.readexactly(length))
+
+
+def send_text(writer: asyncio.StreamWriter, text: str):
+    payload, mask = text.encode('utf-8'), os.urandom(4)
+    writer.write(bytes([0x81, 0x80 | len(payload)]) + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(payload)))
+
+
+async def connect(port: int) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(b'GET /ws HTTP/1.1\r\nHost: test\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                 b'Sec-WebSocket-Key: ' + base64.b64encode(os.urandom(16)) + b'\r\nSec-WebSocket-Version: 13\r\n\r\n')
+    while await reader.readline() != b'\r\n':
+        pass
+    return reader, writer
+
+
+async def play(port: int) -> list:
+    reader, writer = await connect(port)
+    send_text(writer, json.dumps({'type': 'start', 'username': 'kid', 'operation': 'ADDITION', 'seconds': 2}))
+    messages = [await read_message(reader)]
+    bad = ['{not json', '[1, 2]', json.dumps({'type': 'answer'}), json.dumps({'type': 'answer', 'answer': None}),
+           json.dumps({'type': 'answer', 'answer': 'x'})]
+    for text in bad:   # 测试中途收到格式不对的消息
+        send_text(writer, text)
+        messages.append(await read_message(reader))
+    question = messages[0]
+    send_text(writer, json.dumps({'type': 'answer', 'answer': question['value1'] + question['value2']}))
+    while messages[-1]['type'] != 'score':
+        messages.append(await read_message(reader))
+    writer.close()
+    return messages
+
+
+def run_server(client: Callable[[int], Awaitable]):
+    async def run():
+        server = await asyncio.start_server(Classroom().serve, '127.0.0.1', 0)
+        async with server:
+            return await client(server.sockets[0].getsockname()[1])
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def classroom(tmp_path, monkeypatch):
+    """设置和做题记录都放在临时目录"""
+    monkeypatch.chdir(tmp_path)
+    store = history.HistoryStore(str(tmp_path / 'history.db'))
+    monkeypatch.setattr(history, '_history', store)
+    monkeypatch.setattr(settings, '_store', settings.SettingStore(str(tmp_path / 'settings.json')))
+    Setting.save_range('kid', 'ADDITION', [1, 9, 1, 9, 2, 18])
+    yield
+    store.close()
+
+
+def test_bad_answer_frame_keeps_session(classroom):
+    messages = run_server(play)
+    assert messages[0]['type'] == 'question'
+    assert [m['type'] for m in messages[1:6]] == ['error'] * 5
+    assert all(m['fatal'] is False for m in messages[1:6])
+    assert messages[6] == {'type': 'result', 'correct': True, 'ref': messages[0]['value1'] + messages[0]['value2']}
+    assert messages[-1]['type'] == 'score'
+    assert messages[-1]['text'].startswith('错误: 0 / 1')
+
+
+def test_bad_start_frame_is_answered(classroom, monkeypatch):
+    def locked(*args):
+        raise sqlite3.OperationalError('database is locked')
+
+    async def client(port: int) -> list:
+        reader, writer = await connect(port)
+        messages = []
+        for text in ('[1]', '"x"', json.dumps({'type': 'start', 'username': 'kid', 'operation': 'ADDITION'})):
+            send_text(writer, text)
+            messages.append(await read_message(reader))
+        writer.close()
+        return messages
+
+    monkeypatch.setattr(server, 'Session', locked)
+    messages = run_server(client)
+    assert [m['type'] for m in messages] == ['error'] * 3
+    assert 'database is locked' in messages[2]['message']
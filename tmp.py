@@ -1,30 +1,24 @@
-import pyttsx3
-import io
-import sys
+import time
 from loguru import logger
+from speech import Speaker, question_text
 
-# sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+# 合成在后台线程里进行, 这里只是提交任务; 合成好的文件缓存在 speech/ 目录, 第二次运行时直接命中
 
-engine = pyttsx3.init()
+ready = []
+speaker = Speaker(rate=150, volume=1, voice='zh', on_ready=lambda text, path: ready.append((text, path)))
+logger.info(f'set rate={speaker.properties["rate"]} volume={speaker.properties["volume"]} '
+            f'voice={speaker.properties["voice"]}')
 
-""" RATE"""
-engine.setProperty('rate', 150)
-rate = engine.getProperty('rate')
-logger.info(f'set rate={rate}')
-
-"""VOLUME"""
-engine.setProperty('volume', 1)
-volume = engine.getProperty('volume')
-logger.info(f'set volume={volume}')
-
-"""VOICE"""
-engine.setProperty('voice', 'zh')
-voice = engine.getProperty('voice')
-logger.info(f'set voice={voice}')
-
-lines = ['1 + 1 =', '12 + 4 =']
+lines = [question_text(1, '+', 1), question_text(12, '+', 4)]
+speaker.prerender(lines[1:])
+pending = 0
 for line in lines:
-    engine.say(line)
+    path = speaker.speak(line)
+    logger.info(f'{line}: {path or "pending"}')
+    pending += path is None
 
-engine.runAndWait()
-engine.stop()
+while len(ready) < pending:
+    time.sleep(0.05)
+for text, path in ready:
+    logger.info(f'{text}: {path}')
+speaker.close()
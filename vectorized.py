@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+NumPy 批量计算引擎: 每个模板在全部操作数组合上一次算完, 用布尔掩码筛选非负和相等的组合,
+只有留下来的组合才拼成题目字符串. 输出与 test_generator.generate_indexed 完全相同.
+"""
+import numpy as np
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+from expression import Template, get_source, get_templates
+from test_generator import Config, get_question_list
+
+
+class Rational:
+    """分子/分母两个 int64 数组表示的精确有理数, 约分后分母为正; 分母为 0 表示出现了除数为 0"""
+    __slots__ = ('num', 'den')
+
+    def __init__(self, num: np.ndarray, den: np.ndarray):
+        g = np.gcd(num, den)
+        g[g == 0] = 1
+        self.num: np.ndarray = num // g
+        self.den: np.ndarray = den // g
+
+    def __add__(self, other: 'Rational') -> 'Rational':
+        return Rational(self.num * other.den + other.num * self.den, self.den * other.den)
+
+    def __sub__(self, other: 'Rational') -> 'Rational':
+        return Rational(self.num * other.den - other.num * self.den, self.den * other.den)
+
+    def __mul__(self, other: 'Rational') -> 'Rational':
+        return Rational(self.num * other.num, self.den * other.den)
+
+    @staticmethod
+    def divide(a: 'Rational', b: 'Rational') -> 'Rational':
+        num = a.num * b.den
+        den = np.where(b.den == 0, 0, a.den * b.num)
+        sign = np.where(den < 0, -1, 1)
+        return Rational(num * sign, den * sign)
+
+    def valid(self) -> np.ndarray:
+        """除数不为 0 且结果不小于 0"""
+        return (self.den > 0) & (self.num >= 0)
+
+
+_compiled: Dict[Tuple, Callable[[List[Rational]], Rational]] = {}
+
+
+def compile_shape(shape: Tuple, offset: int = 0) -> Callable[[List[Rational]], Rational]:
+    key = (shape, offset)
+    function = _compiled.get(key)
+    if function is None:
+        function = _compiled[key] = eval(f'lambda v: {get_source(shape, offset)}', {'divide': Rational.divide})
+    return function
+
+
+def compile_vectorized(template: Template) -> Callable[[List[Rational]], Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """把模板编译成数组函数, 返回 (分子, 分母, 是否有效)"""
+    function = compile_shape(template.shape)
+    inner = None
+    if template.bracket is not None:
+        i, j = template.bracket
+        inner = compile_shape(template.shape[2 * i + 1: 2 * j + 2], offset=i)
+
+    def evaluate(columns: List[Rational]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        result = function(columns)
+        ok = result.valid()
+        if inner is not None:
+            ok &= inner(columns).valid()   # 括号里的结果不小于0
+        return result.num, result.den, ok
+    return evaluate
+
+
+def get_grid(values: np.ndarray, length: int) -> List[Rational]:
+    """length 个操作数的全部组合, 行的顺序与 itertools.product 相同, 每个操作数一列"""
+    base = len(values)
+    rows = np.arange(base ** length, dtype=np.int64)
+    ones = np.ones(len(rows), dtype=np.int64)
+    return [Rational(values[(rows // base ** (length - 1 - i)) % base], ones) for i in range(length)]
+
+
+Compacted = Dict[int, List[Tuple[np.ndarray, np.ndarray, np.ndarray]]]
+
+
+def compact_templates(values: np.ndarray, length: int) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """每个模板只保留有效的行: (行号, 分子, 分母); 算完一个模板就丢掉它的完整数组"""
+    grid = get_grid(values, length)
+    compact = []
+    for t in get_templates(length, tuple(Config.operates), Config.bracket):
+        num, den, ok = compile_vectorized(t)(grid)
+        compact.append((np.nonzero(ok)[0], num[ok], den[ok]))
+    return compact
+
+
+def get_compacted() -> Compacted:
+    """按当前 Config 计算 1 到 numbers-1 个操作数的全部模板, 多个分片可以共用"""
+    Config.validate()
+    values = np.arange(Config.value_min, Config.value_max + 1, dtype=np.int64)
+    return {k: compact_templates(values, k) for k in range(1, Config.numbers)}
+
+
+def generate_indexed_numpy(start: int = 0, stop: Optional[int] = None,
+                           compact: Optional[Compacted] = None) -> Iterator[Tuple[int, List[str]]]:
+    """按首个操作数分块计算, 每块内按 (组合序号, 等号位置, 左模板, 右模板) 排序后生成题目"""
+    Config.validate()
+    values: List[int] = [v for v in range(Config.value_min, Config.value_max + 1)]
+    base, numbers = len(values), Config.numbers
+    stop = base ** numbers if stop is None else stop
+    if stop <= start:
+        return
+    templates = {k: get_templates(k, tuple(Config.operates), Config.bracket) for k in range(1, numbers)}
+    if compact is None:
+        compact = get_compacted()
+    block = base ** (numbers - 1)
+    for first in range(start // block, (stop - 1) // block + 1):
+        found: List[Tuple[np.ndarray, ...]] = []
+        for k in range(1, numbers):
+            size = base ** (k - 1)   # 首个操作数固定时左侧的组合数
+            right_size = base ** (numbers - k)
+            for t, (left_rows, left_num, left_den) in enumerate(compact[k]):
+                lo, hi = np.searchsorted(left_rows, [first * size, (first + 1) * size])
+                if lo == hi:
+                    continue
+                for s, (right_rows, right_num, right_den) in enumerate(compact[numbers - k]):
+                    mask = np.equal.outer(left_num[lo:hi], right_num) & np.equal.outer(left_den[lo:hi], right_den)
+                    li, ri = np.nonzero(mask)
+                    if len(li):
+                        index = left_rows[lo:hi][li] * right_size + right_rows[ri]
+                        found.append((index, np.full(len(li), k), np.full(len(li), t), np.full(len(li), s)))
+        if not found:
+            continue
+        index, ks, ts, ss = (np.concatenate(c) for c in zip(*found))
+        keep = (index >= start) & (index < stop)
+        order = np.lexsort((ss[keep], ts[keep], ks[keep], index[keep]))
+        current, questions = -1, []
+        for i, k, t, s in zip(*(c[keep][order].tolist() for c in (index, ks, ts, ss))):
+            if i != current:
+                if questions:
+                    yield current, questions
+                current, questions = i, []
+            vs: List[int] = [values[(i // base ** (numbers - 1 - p)) % base] for p in range(numbers)]
+            es: List[Union[int, str]] = [*templates[k][t].tokens(vs[:k]), '=', *templates[numbers - k][s].tokens(vs[k:])]
+            questions.extend(get_question_list(es))
+        if questions:
+            yield current, questions
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+import gzip
+import json
+import os
+import time
+from loguru import logger
+from typing import Any, BinaryIO, Dict, List, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIONS: Dict[Optional[str], str] = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+
+def atomic_write(filename: str, data: bytes):
+    """先写临时文件再替换, 中途崩溃不会留下写了一半的文件"""
+    tmp: str = f'{filename}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, filename)
+
+
+class Progress:
+    """每隔 interval 秒输出一次进度和吞吐量"""
+
+    def __init__(self, total: int, interval: float = 5.0):
+        self.total: int = total
+        self.interval: float = interval
+        self.start_at: float = time.monotonic()
+        self.report_at: float = self.start_at + interval
+        self.questions: int = 0
+        self.bytes: int = 0
+
+    def update(self, index: int, questions: int, nbytes: int):
+        self.questions += questions
+        self.bytes += nbytes
+        now = time.monotonic()
+        if now >= self.report_at:
+            self.report_at = now + self.interval
+            self.report(index + 1, now)
+
+    def report(self, done: int, now: Optional[float] = None):
+        elapsed = max(1e-9, (now or time.monotonic()) - self.start_at)
+        logger.info(f'{done}/{self.total} [{done / max(1, self.total):0.1%}] '
+                    f'questions: {self.questions} ({self.questions / elapsed:0.0f}/s) '
+                    f'bytes: {self.bytes} ({self.bytes / elapsed / 2 ** 20:0.2f}MiB/s)')
+
+
+class QuestionWriter:
+    """
+    题库输出: 大块缓冲写入, 可选 gzip/zstd 压缩, 定期记录检查点(最后完成的操作数组合序号)以便中断后续写.
+
+    每个检查点都结束一段压缩流(gzip member / zstd frame), 续写时把文件截断到最后一个检查点再接着写,
+    多段拼接的结果仍然是合法的 gzip/zstd 文件.
+    """
+
+    def __init__(self, filename: str, config: Dict[str, Any], total: int, compression: Optional[str] = None,
+                 resume: bool = False, buffer_size: int = 1 << 20, checkpoint_interval: float = 30.0):
+        assert compression in COMPRESSIONS, compression
+        if compression == 'zstd' and zstandard is None:
+            raise RuntimeError('zstd compression requires the zstandard package')
+        self.filename: str = filename
+        self.checkpoint: str = f'{filename}.ckpt'
+        self.config: Dict[str, Any] = config
+        self.compression: Optional[str] = compression
+        self.buffer_size: int = buffer_size
+        self.checkpoint_interval: float = checkpoint_interval
+        self.buffer: List[bytes] = []
+        self.buffered: int = 0
+        self.segment: Optional[BinaryIO] = None
+        self.start: int = 0   # 下一个要生成的操作数组合序号
+        self.index: int = -1
+        self.questions: int = 0
+
+        state = self.load_checkpoint() if resume else None
+        if state is None:
+            self.raw: BinaryIO = open(filename, 'wb')
+        else:
+            self.raw = open(filename, 'r+b')
+            self.raw.truncate(state['offset'])
+            self.raw.seek(state['offset'])
+            self.index = state['index']
+            self.start = state['index'] + 1
+            self.questions = state['questions']
+            logger.info(f'resume {filename} from #{self.start} ({self.questions} questions)')
+        self.progress = Progress(total)
+        self.checkpoint_at: float = time.monotonic() + checkpoint_interval
+
+    def load_checkpoint(self) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self.checkpoint) or not os.path.exists(self.filename):
+            return None
+        with open(self.checkpoint, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if state['config'] != self.config or state['compression'] != self.compression:
+            logger.warning(f'{self.checkpoint} does not match the current config, start over')
+            return None
+        return state
+
+    def write(self, questions: List[str]):
+        if questions:
+            self.write_bytes(''.join(f'{q}\n' for q in questions).encode('utf-8'), len(questions))
+
+    def write_bytes(self, data: bytes, questions: int):
+        self.buffer.append(data)
+        self.buffered += len(data)
+        self.questions += questions
+        self.progress.update(self.index, questions, len(data))
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def completed(self, index: int):
+        """序号不大于 index 的操作数组合都已写入"""
+        self.index = index
+        if time.monotonic() >= self.checkpoint_at:
+            self.save_checkpoint()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        if self.segment is None:
+            if self.compression == 'gzip':
+                self.segment = gzip.GzipFile(fileobj=self.raw, mode='wb', compresslevel=6)
+            elif self.compression == 'zstd':
+                self.segment = zstandard.ZstdCompressor().stream_writer(self.raw, closefd=False)
+            else:
+                self.segment = self.raw
+        self.segment.write(b''.join(self.buffer))
+        self.buffer.clear()
+        self.buffered = 0
+
+    def save_checkpoint(self):
+        self.flush()
+        if self.segment is not None and self.segment is not self.raw:
+            self.segment.close()   # 结束当前压缩段, 不关闭 raw
+        self.segment = None
+        self.raw.flush()
+        os.fsync(self.raw.fileno())
+        state = {
+            'config': self.config,
+            'compression': self.compression,
+            'index': self.index,
+            'offset': self.raw.tell(),
+            'questions': self.questions,
+        }
+        atomic_write(self.checkpoint, json.dumps(state).encode('utf-8'))
+        self.checkpoint_at = time.monotonic() + self.checkpoint_interval
+
+    def close(self):
+        self.save_checkpoint()
+        self.raw.close()
+        os.remove(self.checkpoint)
+        self.progress.report(self.index + 1)
+
+    def __enter__(self) -> 'QuestionWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.raw.close()   # 保留上一个检查点, 下次可以续写